@@ -0,0 +1,164 @@
+"""Headless batch export of Documenta documents described by manifests
+
+A manifest is a JSON file listing the document's blocks in order; paths
+are relative to the manifest:
+
+    {
+        "output": "guide.html",
+        "assets": false,
+        "items": [
+            {"image": "shots/01-open-dialog.png"},
+            {"text": "Open the settings dialog."},
+            {"code": "documenta --version"}
+        ]
+    }
+
+Documents are rendered by the same code as CanvasPanel.save_as_html, without
+Qt or a display, several manifests at a time in a process pool. A document
+whose manifest and inputs are unchanged since its last export is skipped.
+
+    python batch_export.py docs/*.json [--jobs N] [--force]
+"""
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from html_export import (HTML_HEAD, HTML_TAIL, RENDER_VERSION, AssetWriter, data_digest, image_asset_html,
+                         image_block_html, stream_html, text_block_html)
+
+STAMP_SUFFIX = '.stamp'
+MIME_TYPES = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
+              '.gif': 'image/gif', '.webp': 'image/webp'}
+
+
+class ManifestError(Exception):
+    pass
+
+
+def load_manifest(path):
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if 'output' not in manifest or not isinstance(manifest.get('items'), list):
+        raise ManifestError(f"{path}: a manifest needs 'output' and an 'items' list")
+    base = os.path.dirname(os.path.abspath(path))
+    items = []
+    for entry in manifest['items']:
+        if 'image' in entry:
+            items.append(('image', os.path.join(base, entry['image'])))
+        elif 'code' in entry:
+            items.append(('code', entry['code']))
+        elif 'text' in entry:
+            items.append(('text', entry['text']))
+        else:
+            raise ManifestError(f"{path}: unknown item {entry!r}")
+    return os.path.join(base, manifest['output']), bool(manifest.get('assets')), items
+
+
+def image_size(data):
+    """Return (width, height) from a PNG, GIF or JPEG header, or None"""
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return struct.unpack('>II', data[16:24])
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return struct.unpack('<HH', data[6:10])
+    if data[:2] == b'\xff\xd8':
+        offset = 2
+        while offset + 9 <= len(data):
+            marker, length = struct.unpack('>HH', data[offset:offset + 4])
+            # SOF0..SOF15 except DHT, JPG and DAC carry the frame size
+            if 0xFFC0 <= marker <= 0xFFCF and marker not in (0xFFC4, 0xFFC8, 0xFFCC):
+                height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+                return width, height
+            offset += 2 + length
+    return None
+
+
+def fingerprint(manifest_path, items):
+    """Digest of everything the output depends on"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(manifest_path, 'rb') as f:
+        digest.update(f.read())
+    digest.update(f'{RENDER_VERSION}'.encode() + HTML_HEAD.encode() + HTML_TAIL.encode())
+    for type_, content in items:
+        if type_ == 'image':
+            stat = os.stat(content)
+            digest.update(f'{content}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()
+
+
+def export_manifest(manifest_path, force=False):
+    """Render one manifest; returns a result dict for reporting"""
+    start = time.perf_counter()
+    output, assets, items = load_manifest(manifest_path)
+    stamp_path = output + STAMP_SUFFIX
+    stamp = fingerprint(manifest_path, items)
+    if not force and os.path.exists(output) and os.path.exists(stamp_path):
+        with open(stamp_path, encoding='utf-8') as f:
+            if f.read().strip() == stamp:
+                return {'manifest': manifest_path, 'output': output, 'skipped': True,
+                        'seconds': time.perf_counter() - start}
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    asset_writer = AssetWriter(output) if assets else None
+
+    def prepare(item):
+        type_, content = item
+        if type_ != 'image':
+            return text_block_html(type_, content)
+
+        def render():
+            # Image files are embedded as they are; nothing is decoded
+            with open(content, 'rb') as f:
+                data = f.read()
+            ext = os.path.splitext(content)[1].lower()
+            if asset_writer:
+                width, height = image_size(data) or (None, None)
+                src = asset_writer.write(data_digest(data), ext.lstrip('.'), lambda: data)
+                return image_asset_html(src, width, height)
+            return image_block_html(data, MIME_TYPES.get(ext, 'application/octet-stream'))
+        return render
+
+    stream_html(output, items, prepare)
+    with open(stamp_path, 'w', encoding='utf-8') as f:
+        f.write(stamp)
+    return {'manifest': manifest_path, 'output': output, 'skipped': False,
+            'seconds': time.perf_counter() - start,
+            'images': sum(1 for type_, _ in items if type_ == 'image'),
+            'bytes': os.path.getsize(output)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render Documenta manifests to HTML without a display")
+    parser.add_argument('manifests', nargs='+', help="manifest JSON files")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="documents rendered in parallel (default: CPU count)")
+    parser.add_argument('--force', action='store_true', help="re-render even if nothing changed")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(export_manifest, path, args.force): path for path in args.manifests}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"FAILED   {path}: {e}", file=sys.stderr)
+                continue
+            if result['skipped']:
+                print(f"skipped  {result['output']} (unchanged) {result['seconds'] * 1000:.0f} ms")
+            else:
+                print(f"rendered {result['output']} in {result['seconds'] * 1000:.0f} ms "
+                      f"({result['images']} images, {result['bytes'] // 1024} KB)")
+    print(f"{len(args.manifests)} documents in {time.perf_counter() - start:.2f} s, {failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""Headless benchmarks for Documenta's canvas, clipboard and export paths
+
+Every (operation, document size) pair runs in a fresh offscreen process so
+peak memory is attributable to it. Documents are synthetic: half
+screenshots, a quarter text and a quarter code blocks.
+
+    python benchmark.py                        # 10/100/1000 items, all operations
+    python benchmark.py --sizes 10 100 --ops save_html copy -o new.json
+    python benchmark.py --compare base.json new.json
+
+Results are JSON: one record per run with wall time in seconds, the peak
+RSS of the process and how much of it the operation added, in KiB, and
+the bytes it produced.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+try:
+    import resource
+except ImportError:  # Windows; peak RSS is not reported
+    resource = None
+
+DEFAULT_SIZES = [10, 100, 1000]
+IMAGE_SIZE = (1280, 800)
+# Distinct pixmaps cycled through by the add_screenshot benchmark; holding
+# one per item would dominate memory at 1000 items
+PIXMAP_POOL = 8
+# Moves and scroll steps per run, independent of document size, so the
+# cost per step is comparable
+MOVES = 100
+SCROLLS = 100
+# One mouse wheel notch
+SCROLL_STEP_PX = 120
+# Relative slowdown reported as a regression by --compare
+DEFAULT_THRESHOLD = 0.10
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def synthetic_image(base, index):
+    """A distinct copy of the rendered base screenshot"""
+    from PyQt6.QtGui import QColor
+    image = base.copy()
+    for x in range(8):
+        image.setPixelColor(x, 0, QColor((index >> (3 * x)) & 0xFF, x, 0))
+    return image
+
+
+def build_canvas(count, with_items=True):
+    """Return a canvas inside a scroll area, as MainWindow has it
+
+    The caller must keep the returned scroll area alive; it owns the canvas.
+    """
+    from PyQt6.QtGui import QPixmap
+    from PyQt6.QtWidgets import QScrollArea
+    from canvas_panel import CanvasPanel
+    from encoding_benchmark import sample_screenshot
+    canvas = CanvasPanel()
+    # Only the viewport is painted when shown, however long the document
+    scroll_area = QScrollArea()
+    scroll_area.setWidgetResizable(True)
+    scroll_area.setWidget(canvas)
+    scroll_area.resize(1000, 800)
+    base = sample_screenshot(*IMAGE_SIZE)
+    pixmaps = [QPixmap.fromImage(synthetic_image(base, i)) for i in range(PIXMAP_POOL)]
+    if with_items:
+        add_items(canvas, count, base)
+    return scroll_area, canvas, pixmaps
+
+
+def add_items(canvas, count, base):
+    for i in range(count):
+        if i % 2 == 0:
+            # Images go straight into the store, which bounds the decoded
+            # working set, so large documents fit in memory
+            handle = canvas.store.add(synthetic_image(base, i))
+            # Wait for the spill so setup holds a bounded working set
+            handle.encoded()
+            canvas.add_image(handle)
+        elif i % 4 == 1:
+            canvas.add_text().setPlainText(f"Step {i}: open the dialog and pick the option.\n" * 3)
+        else:
+            canvas.add_code().setPlainText(
+                '\n'.join(f"def step_{i}_{line}(value):\n    return value * {line}  # note"
+                          for line in range(10)))
+
+
+# Each operation returns the number of bytes it produced, if any; setup
+# before the ``start`` callback is not timed
+
+# Events are processed after every add, move and scroll step, as the GUI
+# does between user actions, so work deferred to the event loop is timed
+# once per step rather than once per run
+
+def op_add_screenshot(app, canvas, pixmaps, count, tmpdir, start):
+    canvas.window().show()
+    app.processEvents()
+    start()
+    for i in range(count):
+        canvas.add_screenshot(pixmaps[i % len(pixmaps)])
+        app.processEvents()
+    return None
+
+
+def op_move(app, canvas, pixmaps, count, tmpdir, start):
+    canvas.window().show()
+    app.processEvents()
+    rng = random.Random(count)
+    start()
+    for _ in range(MOVES):
+        # What dropEvent does: locate the target, then move the item
+        source = rng.randrange(len(canvas.items))
+        target = canvas.item_rect(rng.randrange(len(canvas.items)))
+        drop_index = canvas.get_drop_index(target.y() + 1)
+        if drop_index > source:
+            drop_index -= 1
+        canvas.move_item(source, drop_index)
+        app.processEvents()
+    return None
+
+
+def op_scroll(app, canvas, pixmaps, count, tmpdir, start):
+    canvas.window().show()
+    app.processEvents()
+    scroll_bar = canvas.window().verticalScrollBar()
+    start()
+    value, step = 0, SCROLL_STEP_PX
+    for _ in range(SCROLLS):
+        # Wheel down through the document, and back up from its end. In a
+        # long document more steps reach screenshots whose thumbnails have
+        # yet to be made, as they would for a user
+        if not 0 <= value + step <= scroll_bar.maximum():
+            step = -step
+        value += step
+        scroll_bar.setValue(value)
+        app.processEvents()
+    return None
+
+
+def op_copy(app, canvas, pixmaps, count, tmpdir, start):
+    start()
+    mime_data = canvas.copy_to_clipboard()
+    # What a rich-text paste target asks for
+    return len(mime_data.text()) + len(mime_data.html())
+
+
+def op_snapshot(app, canvas, pixmaps, count, tmpdir, start):
+    # What starting a background export costs the GUI thread after every
+    # text block was edited
+    for type_, _, content in canvas.items:
+        if type_ != 'image':
+            content.appendPlainText("edited")
+    start()
+    canvas.snapshot()
+    return None
+
+
+def op_save_html(app, canvas, pixmaps, count, tmpdir, start):
+    path = os.path.join(tmpdir, 'out.html')
+    start()
+    canvas.save_as_html(path)
+    return os.path.getsize(path)
+
+
+def op_save_html_assets(app, canvas, pixmaps, count, tmpdir, start):
+    path = os.path.join(tmpdir, 'out.html')
+    start()
+    canvas.save_as_html(path, assets=True)
+    assets = os.path.join(tmpdir, 'assets')
+    return os.path.getsize(path) + sum(os.path.getsize(os.path.join(assets, name))
+                                       for name in os.listdir(assets))
+
+
+def op_export_docx(app, canvas, pixmaps, count, tmpdir, start):
+    import exporters
+    exporter = exporters.get('docx')
+    path = os.path.join(tmpdir, 'out.docx')
+    start()
+    exporter.export(canvas, path)
+    return os.path.getsize(path)
+
+
+def op_save_project(app, canvas, pixmaps, count, tmpdir, start):
+    from project_file import ProjectFile
+    path = os.path.join(tmpdir, 'out.docproj')
+    start()
+    ProjectFile(path).save(canvas.document_items())
+    return os.path.getsize(path)
+
+
+OPERATIONS = {
+    'add_screenshot': op_add_screenshot,
+    'move': op_move,
+    'scroll': op_scroll,
+    'copy': op_copy,
+    'snapshot': op_snapshot,
+    'save_html': op_save_html,
+    'save_html_assets': op_save_html_assets,
+    'export_docx': op_export_docx,
+    'save_project': op_save_project,
+}
+
+
+def run_child(operation, count):
+    """Run one benchmark in this process and print its result as JSON"""
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication(sys.argv[:1])
+    scroll_area, canvas, pixmaps = build_canvas(count, with_items=operation != 'add_screenshot')
+    app.processEvents()
+    timing = {}
+
+    def start():
+        timing['rss'] = peak_rss_kb()
+        timing['start'] = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix='documenta-bench-') as tmpdir:
+        output_bytes = OPERATIONS[operation](app, canvas, pixmaps, count, tmpdir, start)
+        seconds = time.perf_counter() - timing['start']
+        peak = peak_rss_kb()
+        store = canvas.store.stats()
+        cache = canvas.image_cache.stats()
+        canvas.clear()
+    print(json.dumps({
+        'operation': operation,
+        'items': count,
+        'seconds': round(seconds, 6),
+        'peak_rss_kb': peak,
+        'rss_added_kb': None if peak is None else peak - timing['rss'],
+        'output_bytes': output_bytes,
+        'store': store,
+        'image_cache': cache,
+    }))
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_suite(operations, sizes, repeat):
+    results = []
+    for operation in operations:
+        for count in sizes:
+            runs = []
+            for _ in range(repeat):
+                child = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', operation, str(count)],
+                                       capture_output=True, text=True)
+                if child.returncode != 0:
+                    print(f"{operation} x{count} failed:\n{child.stderr}", file=sys.stderr)
+                    break
+                runs.append(json.loads(child.stdout.strip().splitlines()[-1]))
+            if not runs:
+                continue
+            # Keep the fastest run; memory and output size barely vary
+            result = min(runs, key=lambda run: run['seconds'])
+            results.append(result)
+            rss = '' if result['peak_rss_kb'] is None else \
+                f"{result['peak_rss_kb'] / 1024:8.0f} MiB peak {result['rss_added_kb'] / 1024:+7.0f} MiB"
+            out = '' if result['output_bytes'] is None else f"{result['output_bytes'] / 1024:10.0f} KiB out"
+            decodes = f"{result['store']['decodes']:6} decodes"
+            cache = result['image_cache']
+            hits = f"{cache['hits']:6}/{cache['hits'] + cache['misses']} cache hits"
+            print(f"{operation:<18} {count:>6} items {result['seconds'] * 1000:10.1f} ms {rss} {out} {decodes} {hits}")
+    return results
+
+
+def compare(base_path, new_path, threshold):
+    """Print per-run ratios of two result files; returns the regression count"""
+    with open(base_path, encoding='utf-8') as f:
+        base = {(r['operation'], r['items']): r for r in json.load(f)['results']}
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)['results']
+    regressions = 0
+    print(f"{'operation':<18} {'items':>6} {'base ms':>10} {'new ms':>10} {'time':>7} {'peak':>7} {'output':>7}")
+    for result in new:
+        old = base.get((result['operation'], result['items']))
+        if old is None:
+            continue
+
+        def ratio(field):
+            if not old.get(field) or result.get(field) is None:
+                return '-'
+            return f"{result[field] / old[field]:.2f}x"
+        slower = old['seconds'] > 0 and result['seconds'] / old['seconds'] > 1 + threshold
+        regressions += slower
+        print(f"{result['operation']:<18} {result['items']:>6} {old['seconds'] * 1000:>10.1f} "
+              f"{result['seconds'] * 1000:>10.1f} {ratio('seconds'):>7} {ratio('peak_rss_kb'):>7} "
+              f"{ratio('output_bytes'):>7}{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless Documenta benchmarks")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="document sizes in items")
+    parser.add_argument('--ops', nargs='+', choices=sorted(OPERATIONS), default=list(OPERATIONS),
+                        help="operations to run")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per benchmark, fastest is kept")
+    parser.add_argument('-o', '--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help="compare two result files")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown counted as a regression by --compare (default 0.10)")
+    parser.add_argument('--child', nargs=2, metavar=('OP', 'ITEMS'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args.child[0], int(args.child[1]))
+        return 0
+    if args.compare:
+        return 1 if compare(*args.compare, args.threshold) else 0
+
+    results = run_suite(args.ops, args.sizes, max(1, args.repeat))
+    report = {
+        'revision': revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
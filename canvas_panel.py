@@ -1,9 +1,212 @@
-from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QTextEdit, 
-                           QScrollArea, QFrame, QApplication)
-from PyQt6.QtCore import Qt, QMimeData
-from PyQt6.QtGui import QPixmap, QDrag, QImage
-import io
-from PyQt6.QtCore import QBuffer
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QPlainTextEdit, 
+                           QScrollArea, QFrame, QApplication, QMenu)
+from PyQt6.QtCore import Qt, QEvent, QMimeData, QRect, QTimer, pyqtSignal
+from PyQt6.QtGui import (QPixmap, QDrag, QImage, QPainter, QColor, QFont, QSyntaxHighlighter,
+                         QTextCharFormat)
+from clipboard_mime import FRAGMENT_MIME, DocumentMimeData, fragment_items
+from code_tokens import TOKEN_COLORS, tokenize_line
+from document_model import DocumentModel
+from encoding_profile import DEFAULT_PROFILE, EncodingProfile
+from html_export import data_digest
+from image_cache import DIGEST, EncodedImageCache
+from image_encoding import encode_image
+from image_store import STORE_FORMAT, ImageStore
+from tracing import span
+
+# Screenshots are displayed no wider than this; the full-resolution pixels
+# are only needed for export
+MAX_DISPLAY_WIDTH = 960
+THUMBNAIL_CACHE_BYTES = 96 * 1024 * 1024
+# Screenshot items only have widgets while within this distance of the
+# viewport; further away they just reserve their height
+REALIZE_MARGIN_PX = 600
+# Around and between items, as the default box layout had them
+CANVAS_MARGIN = 9
+ITEM_SPACING = 6
+
+# Text and code editors grow with their line count between these bounds
+# and scroll internally beyond the maximum
+MIN_EDITOR_LINES = 5
+MAX_EDITOR_LINES = 30
+
+class ThumbnailCache:
+    """LRU of downscaled display pixmaps, bounded by their pixel memory"""
+
+    def __init__(self, max_bytes=THUMBNAIL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+
+    def get(self, handle, width):
+        key = (handle.cacheKey(), width)
+        thumbnail = self._entries.get(key)
+        if thumbnail is not None:
+            self._entries.move_to_end(key)
+            return thumbnail
+        # Decode from the image store only to downscale; the full-size
+        # image is never turned into a display pixmap
+        thumbnail = QPixmap.fromImage(
+            handle.toImage().scaledToWidth(width, Qt.TransformationMode.SmoothTransformation))
+        self._entries[key] = thumbnail
+        self.size_bytes += self._sizeof(thumbnail)
+        while self.size_bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.size_bytes -= self._sizeof(evicted)
+        return thumbnail
+
+    def invalidate(self, cache_key):
+        for key in [key for key in self._entries if key[0] == cache_key]:
+            self.size_bytes -= self._sizeof(self._entries.pop(key))
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
+
+    @staticmethod
+    def _sizeof(pixmap):
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+def display_size(handle):
+    """Return the ``(width, height)`` a screenshot is shown at on the canvas"""
+    width = max(1, min(handle.width(), MAX_DISPLAY_WIDTH))
+    return width, max(1, round(width * handle.height() / max(1, handle.width())))
+
+class ScreenshotView(QWidget):
+    """Lightweight stand-in for a screenshot on the canvas
+
+    Unlike a QLabel it never holds a full-resolution display pixmap. It
+    takes the scaled size and, when Qt asks it to paint, draws a thumbnail
+    from the shared ThumbnailCache, creating it on first use. Views are
+    recycled between screenshots as they scroll in and out of view.
+    """
+
+    def __init__(self, thumbnails, parent=None):
+        super().__init__(parent)
+        self.handle = None
+        self.thumbnails = thumbnails
+
+    def set_handle(self, handle):
+        self.handle = handle
+        if handle is not None:
+            self.setFixedSize(*display_size(handle))
+            self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        if self.handle.isNull():
+            painter.fillRect(self.rect(), QColor('#e0e0e0'))
+            return
+        painter.drawPixmap(0, 0, self.thumbnails.get(self.handle, self.width()))
+
+class ItemCenters:
+    """Read-only sequence of the vertical centre of each canvas item, for bisect
+
+    Computed on demand from the offsets CanvasPanel keeps, so finding a drop position never touches the widgets, which most
+    screenshots don't have.
+    """
+
+    def __init__(self, tops, heights):
+        self.tops = tops
+        self.heights = heights
+
+    def __len__(self):
+        return len(self.tops)
+
+    def __getitem__(self, index):
+        return self.tops[index] + self.heights[index] / 2
+
+class ImageRow:
+    """Container of a screenshot item, standing in for its widget
+
+    Only the rows near the viewport are lent a DraggableWidget holding a
+    ScreenshotView, from a pool the canvas recycles as it scrolls; the
+    rest are just their reserved height. Like the widget containers of
+    text items, rows identify their item to the canvas's observers.
+    """
+
+    __slots__ = ('canvas', 'handle', 'widget')
+
+    def __init__(self, canvas, handle):
+        self.canvas = canvas
+        self.handle = handle
+        self.widget = None
+
+    def geometry(self):
+        return self.canvas.item_rect(self.canvas.index_of(self))
+
+    def y(self):
+        return self.geometry().y()
+
+class CodeHighlighter(QSyntaxHighlighter):
+    """Syntax highlighting for code blocks
+
+    Qt only calls highlightBlock() for blocks that changed, and for the
+    following ones while their starting state changes, so typing in a long
+    snippet re-tokenizes a line or two. Tokens come from the shared,
+    memoized tokenize_line(), which the HTML export then reuses.
+    """
+
+    def __init__(self, document):
+        super().__init__(document)
+        self.formats = {}
+        for kind, color in TOKEN_COLORS.items():
+            char_format = QTextCharFormat()
+            char_format.setForeground(QColor(color))
+            self.formats[kind] = char_format
+
+    def highlightBlock(self, text):
+        tokens, state = tokenize_line(text, max(0, self.previousBlockState()))
+        for start, length, kind in tokens:
+            self.setFormat(start, length, self.formats[kind])
+        self.setCurrentBlockState(state)
+
+class BlockEditor(QPlainTextEdit):
+    """Plain-text editor for text and code items
+
+    QPlainTextEdit lays out one block per line, so multi-megabyte pastes
+    stay responsive. The editor is sized to its line count, up to
+    MAX_EDITOR_LINES, and scrolls internally past that. toPlainText() is
+    cached until the document's contents change, so copy, export and the
+    journal don't rebuild large strings for an unchanged item.
+    """
+
+    def __init__(self, placeholder, parent=None):
+        super().__init__(parent)
+        self.setPlaceholderText(placeholder)
+        self._text = None
+        self._lines = 0
+        self.document().contentsChange.connect(self._invalidate)
+        self.blockCountChanged.connect(self._fit_height)
+        self._fit_height(self.blockCount())
+
+    def toPlainText(self):
+        if self._text is None:
+            self._text = super().toPlainText()
+        return self._text
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.FontChange:
+            self._lines = 0
+            self._fit_height(self.blockCount())
+
+    def _invalidate(self, position, removed, added):
+        self._text = None
+
+    def _fit_height(self, block_count):
+        lines = max(MIN_EDITOR_LINES, min(block_count, MAX_EDITOR_LINES))
+        if lines == self._lines:
+            return
+        self._lines = lines
+        margins = self.contentsMargins()
+        height = (lines * self.fontMetrics().lineSpacing() + 2 * self.document().documentMargin()
+                  + margins.top() + margins.bottom())
+        if self.lineWrapMode() == QPlainTextEdit.LineWrapMode.NoWrap:
+            # Leave room for the horizontal scroll bar long lines bring
+            height += self.horizontalScrollBar().sizeHint().height()
+        self.setFixedHeight(int(height))
 
 class DraggableWidget(QFrame):
     def __init__(self, parent=None):
@@ -13,6 +216,9 @@ class DraggableWidget(QFrame):
         self.layout.setContentsMargins(5, 5, 5, 5)
         # Make the widget visually indicate it's draggable
         self.setCursor(Qt.CursorShape.OpenHandCursor)
+        # The ImageRow a pooled screenshot widget is lent to
+        self.row = None
+        self.dragging = False
         
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
@@ -39,43 +245,322 @@ class DraggableWidget(QFrame):
         drag.setPixmap(pixmap.scaled(pixmap.width()//2, pixmap.height()//2, Qt.AspectRatioMode.KeepAspectRatio))
         drag.setHotSpot(event.pos())
         
-        # Execute the drag operation
-        result = drag.exec(Qt.DropAction.MoveAction)
+        # Execute the drag operation; the canvas doesn't recycle the widget
+        # while it's being dragged
+        self.dragging = True
+        try:
+            result = drag.exec(Qt.DropAction.MoveAction)
+        finally:
+            self.dragging = False
 
 class CanvasPanel(QWidget):
+    # Emitted after every change to ``items`` so observers such as the
+    # journal can follow along without polling
+    item_added = pyqtSignal(int)          # index of the new item
+    item_removed = pyqtSignal(int, object)  # old index, the removed (type, container, content)
+    item_moved = pyqtSignal(int, int)     # old index, new index
+    item_edited = pyqtSignal(object)      # container of an edited text/code item
+    cleared = pyqtSignal()
+
     def __init__(self):
         super().__init__()
-        self.layout = QVBoxLayout(self)
-        self.layout.setAlignment(Qt.AlignmentFlag.AlignTop)
         self.setAcceptDrops(True)
         self.items = []
+        # Items are stacked by the canvas rather than a QVBoxLayout, so a
+        # screenshot needs no widget until it's near the viewport. The top
+        # and height of each item are kept up to date as items come, go and
+        # move, touching only the offsets that change
+        self._tops = []
+        self._heights = []
+        # Minimum width of each container, and how many items need each
+        self._row_widths = {}
+        self._widths = Counter()
+        # [start, stop) of the items whose text widgets haven't been moved
+        # to their offsets yet, and text containers whose size hint changed
+        self._unplaced = None
+        self._resized = set()
+        self._place_timer = QTimer(self)
+        self._place_timer.setSingleShot(True)
+        self._place_timer.timeout.connect(self._place)
+        self._watching_viewport = False
+        # container -> position in ``items``, so a dragged or clicked widget
+        # is found without scanning
+        self._index = {}
+        # The same items without widgets, for snapshots; texts edited since
+        # the last snapshot are read back from these containers' editors
+        self.document = DocumentModel()
+        self._stale = set()
+        self.image_cache = EncodedImageCache()
+        self.thumbnails = ThumbnailCache()
+        self.store = ImageStore()
+        # How screenshots are encoded for HTML, the clipboard and DOCX
+        self.encoding_profile = DEFAULT_PROFILE
+        # ImageRows lent a widget, and widgets free to be lent
+        self._realized = set()
+        self._pool = [self._new_image_widget()]
+        # Screenshot rows are their view plus the container's frame and margins
+        probe = self._pool[0]
+        margins = probe.layout.contentsMargins()
+        self._row_chrome = 2 * probe.frameWidth() + margins.top() + margins.bottom()
         
     def add_screenshot(self, pixmap):
-        container = DraggableWidget(self)
-        label = QLabel()
-        label.setPixmap(pixmap)
-        container.layout.addWidget(label)
-        self.layout.addWidget(container)
-        self.items.append(('image', container, pixmap))
+        # Pixels live in the image store from here on; the canvas and the
+        # exporters only hold the handle
+        with span('canvas.add_screenshot'):
+            return self.add_image(self.store.add(pixmap))
+        
+    def add_image(self, handle):
+        """Add a screenshot that is already in the image store"""
+        return self.insert_item(len(self.items), 'image', handle)
         
     def add_text(self):
-        container = DraggableWidget(self)
-        text_edit = QTextEdit()
-        text_edit.setMinimumHeight(100)
-        text_edit.setPlaceholderText("Enter text here...")
-        container.layout.addWidget(text_edit)
-        self.layout.addWidget(container)
-        self.items.append(('text', container, text_edit))
+        return self.insert_item(len(self.items), 'text', '')
         
     def add_code(self):
+        return self.insert_item(len(self.items), 'code', '')
+
+    def insert_item(self, index, type_, content):
+        """Insert a ``(type, text or image handle)`` item at ``index``
+
+        Returns the image handle, or the editor of a text or code item.
+        """
+        if type_ == 'image':
+            self._insert(index, type_, ImageRow(self, content), content)
+            return content
         container = DraggableWidget(self)
-        code_edit = QTextEdit()
-        code_edit.setMinimumHeight(100)
-        code_edit.setPlaceholderText("Enter code here...")
-        code_edit.setStyleSheet("font-family: 'Courier New'; background-color: #f0f0f0;")
-        container.layout.addWidget(code_edit)
-        self.layout.addWidget(container)
-        self.items.append(('code', container, code_edit))
+        editor = BlockEditor("Enter code here..." if type_ == 'code' else "Enter text here...")
+        if type_ == 'code':
+            editor.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+            editor.setFont(QFont('Courier New'))
+            editor.setStyleSheet("background-color: #f0f0f0;")
+            editor.highlighter = CodeHighlighter(editor.document())
+        # Set before textChanged is connected, so it doesn't count as an edit
+        editor.setPlainText(content)
+        container.layout.addWidget(editor)
+        editor.textChanged.connect(lambda: self._text_changed(container))
+        # Tells the canvas when the editor grows or shrinks
+        container.installEventFilter(self)
+        self._insert(index, type_, container, editor)
+        container.setGeometry(self.item_rect(index))
+        container.show()
+        return editor
+
+    def _insert(self, index, type_, container, content):
+        self.items.insert(index, (type_, container, content))
+        if type_ == 'image':
+            width, height = display_size(content)
+            width += self._row_chrome
+            height += self._row_chrome
+        else:
+            width = container.minimumSizeHint().width()
+            height = container.sizeHint().height()
+        self._tops.insert(index, self._tops[index] if index < len(self._tops) else self._bottom())
+        self._heights.insert(index, height)
+        self._shift(index + 1, height + ITEM_SPACING)
+        self._row_widths[container] = width
+        self._widths[width] += 1
+        self._invalidate(index, len(self.items))
+        self.document.insert(index, type_, content if type_ == 'image' else content.toPlainText())
+        self._reindex(index, len(self.items))
+        self.item_added.emit(index)
+
+    def set_item_text(self, index, text):
+        """Replace the text of the text or code item at ``index``"""
+        self.items[index][2].setPlainText(text)
+
+    def _text_changed(self, container):
+        # Editors of removed items still signal as they're destroyed
+        if container not in self._index:
+            return
+        self._stale.add(container)
+        self.item_edited.emit(container)
+
+    def _reindex(self, start, stop):
+        for i in range(start, stop):
+            self._index[self.items[i][1]] = i
+
+    def index_of(self, container):
+        """Return the position of ``container`` in ``items``, or -1"""
+        return self._index.get(container, -1)
+
+    def move_item(self, source_index, index):
+        """Move the item at ``source_index`` so it ends up at ``index``"""
+        if index == source_index:
+            return
+        with span('canvas.move'):
+            item = self.items.pop(source_index)
+            self.items.insert(index, item)
+            self.document.move(source_index, index)
+            # Only the items between the two positions shifted, and only
+            # their offsets change
+            start, stop = min(source_index, index), max(source_index, index) + 1
+            self._reindex(start, stop)
+            self._heights.insert(index, self._heights.pop(source_index))
+            y = self._tops[start]
+            for i in range(start, stop):
+                self._tops[i] = y
+                y += self._heights[i] + ITEM_SPACING
+            self._invalidate(start, stop)
+        self.item_moved.emit(source_index, index)
+
+    def remove_item(self, index):
+        """Remove and return the item at ``index``"""
+        with span('canvas.remove'):
+            item = self.items.pop(index)
+            self.document.pop(index)
+            del self._index[item[1]]
+            self._stale.discard(item[1])
+            self._reindex(index, len(self.items))
+            self._tops.pop(index)
+            self._shift(index, -(self._heights.pop(index) + ITEM_SPACING))
+            self._forget_width(item[1])
+            self._invalidate(index, len(self.items))
+            self.forget_item(item)
+        self.item_removed.emit(index, item)
+        return item
+
+    def item_at(self, pos):
+        """Return the index of the item under ``pos``, or -1"""
+        index = bisect_right(self._tops, pos.y()) - 1
+        if index >= 0 and self.item_rect(index).contains(pos):
+            return index
+        return -1
+
+    def item_rect(self, index):
+        """Return where the item at ``index`` is, whether or not it has a widget"""
+        return QRect(CANVAS_MARGIN, self._tops[index],
+                     max(0, self.width() - 2 * CANVAS_MARGIN), self._heights[index])
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if event.size().width() != event.oldSize().width():
+            # Every widget takes the new width
+            self._invalidate(0, len(self.items))
+            self._place()
+        else:
+            self._update_visible()
+
+    def moveEvent(self, event):
+        # The scroll area scrolls by moving the canvas inside its viewport
+        super().moveEvent(event)
+        self._update_visible()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        parent = self.parentWidget()
+        if parent is not None and not self._watching_viewport:
+            # The viewport can grow without moving or resizing the canvas
+            parent.installEventFilter(self)
+            self._watching_viewport = True
+        self._update_visible()
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Type.Resize and watched is self.parentWidget():
+            self._update_visible()
+        elif event.type() == QEvent.Type.LayoutRequest and watched in self._index:
+            # A text container's size hint changed, e.g. as its editor grows
+            # with its line count
+            self._resized.add(watched)
+            self._place_timer.start()
+        return False
+
+    def _bottom(self):
+        # Where an item appended now would start
+        if not self._tops:
+            return CANVAS_MARGIN
+        return self._tops[-1] + self._heights[-1] + ITEM_SPACING
+
+    def _shift(self, start, delta):
+        if delta and start < len(self._tops):
+            self._tops[start:] = [top + delta for top in self._tops[start:]]
+
+    def _forget_width(self, container):
+        width = self._row_widths.pop(container)
+        self._widths[width] -= 1
+        if not self._widths[width]:
+            del self._widths[width]
+
+    def _invalidate(self, start, stop):
+        """Have _place() move the text widgets of items ``start`` to ``stop``"""
+        if self._unplaced is not None:
+            start = min(start, self._unplaced[0])
+            stop = max(stop, self._unplaced[1])
+        self._unplaced = (start, stop)
+        self._place_timer.start()
+
+    def _place(self):
+        """Move widgets to their items' offsets and size the canvas to fit
+
+        Runs once per event loop pass however many changes were made, and
+        only visits the items that changed or were shifted by a change.
+        """
+        self._place_timer.stop()
+        for container in self._resized:
+            index = self._index.get(container)
+            if index is None:
+                continue
+            delta = container.sizeHint().height() - self._heights[index]
+            if delta:
+                self._heights[index] += delta
+                self._shift(index + 1, delta)
+                self._invalidate(index, len(self.items))
+        self._resized.clear()
+        if self._unplaced is not None:
+            (start, stop), self._unplaced = self._unplaced, None
+            for index in range(start, min(stop, len(self.items))):
+                type_, container, content = self.items[index]
+                if type_ != 'image':
+                    container.setGeometry(self.item_rect(index))
+        for row in self._realized:
+            row.widget.setGeometry(self.item_rect(self._index[row]))
+        height = self._bottom() - (ITEM_SPACING if self._tops else 0) + CANVAS_MARGIN
+        self.setMinimumSize(max(self._widths, default=0) + 2 * CANVAS_MARGIN, height)
+        self._update_visible()
+
+    def _update_visible(self):
+        """Lend widgets to the screenshots near the viewport, and take back the rest"""
+        visible = self.visibleRegion().boundingRect()
+        if visible.isEmpty():
+            return
+        top = visible.top() - REALIZE_MARGIN_PX
+        bottom = visible.bottom() + REALIZE_MARGIN_PX
+        wanted = set()
+        for index in range(max(0, bisect_right(self._tops, top) - 1), len(self.items)):
+            if self._tops[index] > bottom:
+                break
+            type_, row, handle = self.items[index]
+            if type_ == 'image':
+                wanted.add(row)
+                if row.widget is None:
+                    self._realize(row, index)
+        for row in self._realized - wanted:
+            # A widget being dragged stays with its row until the drop
+            if not row.widget.dragging:
+                self._release(row)
+
+    def _new_image_widget(self):
+        widget = DraggableWidget(self)
+        widget.view = ScreenshotView(self.thumbnails)
+        widget.layout.addWidget(widget.view)
+        widget.hide()
+        return widget
+
+    def _realize(self, row, index):
+        widget = self._pool.pop() if self._pool else self._new_image_widget()
+        widget.row = row
+        widget.view.set_handle(row.handle)
+        row.widget = widget
+        self._realized.add(row)
+        widget.setGeometry(self.item_rect(index))
+        widget.show()
+
+    def _release(self, row):
+        widget, row.widget = row.widget, None
+        self._realized.discard(row)
+        widget.row = None
+        widget.view.set_handle(None)
+        widget.hide()
+        self._pool.append(widget)
         
     def dragEnterEvent(self, event):
         if event.mimeData().hasText() and event.mimeData().text() == 'move':
@@ -89,122 +574,143 @@ class CanvasPanel(QWidget):
         widget = event.source()
         if not widget:
             return
+        # A screenshot's widget is lent to it by its ImageRow
+        container = getattr(widget, 'row', None) or widget
             
         # Get the drop position
         drop_pos = event.position().y()
         drop_index = self.get_drop_index(drop_pos)
         
-        # Find the widget in our items list
-        source_index = -1
-        for i, (_, container, _) in enumerate(self.items):
-            if container == widget:
-                source_index = i
-                break
-                
+        source_index = self.index_of(container)
         if source_index != -1:
-            # Move the item in our items list
-            item = self.items.pop(source_index)
             if drop_index > source_index:
                 drop_index -= 1
-            self.items.insert(drop_index, item)
-            self.update_layout()
+            self.move_item(source_index, drop_index)
             
         event.acceptProposedAction()
                 
     def get_drop_index(self, y):
-        # Find the index where to insert the dragged widget
-        for i, (_, container, _) in enumerate(self.items):
-            widget_center = container.y() + container.height() / 2
-            if y < widget_center:
-                return i
-        return len(self.items)
-        
-    def update_layout(self):
-        # Remove all widgets from layout
-        for i in reversed(range(self.layout.count())): 
-            widget = self.layout.itemAt(i).widget()
-            if widget:
-                self.layout.removeWidget(widget)
-                
-        # Add them back in the new order
-        for _, container, _ in self.items:
-            self.layout.addWidget(container)
+        # Insert before the first item whose centre is below the drop point
+        return bisect_right(ItemCenters(self._tops, self._heights), y)
             
-    def get_content_as_text(self):
-        mime_data = QMimeData()
-        text_parts = []
-        html_parts = []
-        
-        for type_, _, content in self.items:
-            if type_ == 'image':
-                # For images, we need to handle them differently
-                buffer = QBuffer()
-                buffer.open(QBuffer.OpenModeFlag.WriteOnly)
-                content.save(buffer, 'PNG')  # Save pixmap directly
-                buffer_data = buffer.data()
-                base64_data = buffer_data.toBase64().data().decode()
-                html_parts.append(f'<img src="data:image/png;base64,{base64_data}">')
-                text_parts.append('[Image]')
-                buffer.close()
-                
-                # Also set the image in the mime data
-                mime_data.setImageData(content)
-            else:
-                text = content.toPlainText()
-                text_parts.append(text)
-                if type_ == 'code':
-                    html_parts.append(f'<pre style="background-color: #f0f0f0; font-family: \'Courier New\'">{text}</pre>')
-                else:
-                    html_parts.append(f'<p>{text}</p>')
-        
-        text_content = '\n\n'.join(text_parts)
-        html_content = ''.join(html_parts)
-        mime_data.setText(text_content)
-        mime_data.setHtml(html_content)
+    def copy_to_clipboard(self):
+        """Put the canvas on the clipboard; formats are rendered on paste"""
+        with span('clipboard.snapshot'):
+            mime_data = DocumentMimeData(self.snapshot())
         QApplication.clipboard().setMimeData(mime_data)
-        return text_content
-    
-    def save_as_html(self, filename):
-        """Save the canvas content as an HTML file"""
-        text_parts = []
-        html_parts = []
-        
-        for type_, _, content in self.items:
-            if type_ == 'image':
-                buffer = QBuffer()
-                buffer.open(QBuffer.OpenModeFlag.WriteOnly)
-                content.save(buffer, 'PNG')
-                buffer_data = buffer.data()
-                base64_data = buffer_data.toBase64().data().decode()
-                html_parts.append(f'<img src="data:image/png;base64,{base64_data}">')
-                buffer.close()
+        return mime_data
+
+    def paste_from_clipboard(self):
+        """Append the clipboard's contents and return the number of items added
+
+        A Documenta fragment is pasted block for block with its screenshots
+        at full quality; otherwise an image becomes a screenshot and text a
+        text box.
+        """
+        mime_data = QApplication.clipboard().mimeData()
+        if mime_data is None:
+            return 0
+        with span('clipboard.paste'):
+            if mime_data.hasFormat(FRAGMENT_MIME):
+                items = fragment_items(mime_data.data(FRAGMENT_MIME), self.store)
+            elif mime_data.hasImage():
+                items = [('image', self.store.add(mime_data.imageData()))]
+            elif mime_data.hasText():
+                items = [('text', mime_data.text())]
             else:
-                text = content.toPlainText()
-                if type_ == 'code':
-                    html_parts.append(f'<pre style="background-color: #f0f0f0; font-family: \'Courier New\'">{text}</pre>')
-                else:
-                    html_parts.append(f'<p>{text}</p>')
-        
-        html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>Documenta Export</title>
-    <style>
-        body {{ font-family: Arial, sans-serif; margin: 20px; }}
-        pre {{ background-color: #f0f0f0; padding: 10px; border-radius: 5px; }}
-        img {{ max-width: 100%; }}
-    </style>
-</head>
-<body>
-    {''.join(html_parts)}
-</body>
-</html>"""
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        
-        return html_content
+                items = []
+            self.load_items(items)
+        return len(items)
+
+    def save_as_html(self, filename, progress=None, assets=False):
+        """Save the canvas content as an HTML file; see DocumentSnapshot.save_as_html"""
+        return self.snapshot().save_as_html(filename, progress, assets)
+
+    def snapshot(self):
+        """Return a DocumentSnapshot of the items, readable from any thread
+
+        Only the texts edited since the last snapshot are read from their
+        editors; everything else is shared with the previous one.
+        """
+        for container in self._stale:
+            index = self._index[container]
+            self.document.set_text(index, self.items[index][2].toPlainText())
+        self._stale.clear()
+        return self.document.snapshot(self.encoding_profile, self.image_jobs, self.store)
+
+    def image_jobs(self, handle, *fmts):
+        """Return one callable per format producing the image encoded that way
+
+        A format is a Qt format name, DIGEST or an EncodingProfile.
+        STORE_FORMAT bytes come straight from the image store; anything else
+        comes from and goes to ``image_cache``, so the clipboard, the
+        exporters and repeated exports share one encoding per image. The
+        callables only touch the thread-safe image store and may run on
+        worker threads.
+        """
+        key = handle.cacheKey()
+
+        def job(fmt):
+            if isinstance(fmt, EncodingProfile):
+                if fmt.passthrough:
+                    return handle.encoded
+                profile, fmt = fmt, fmt.key
+                value = self.image_cache.lookup(key, fmt)
+                if value is not None:
+                    return lambda: value
+                return lambda: self.image_cache.store(key, fmt, profile.encode(handle.toImage()))
+            if fmt == STORE_FORMAT:
+                return handle.encoded
+            value = self.image_cache.lookup(key, fmt)
+            if value is not None:
+                return lambda: value
+            if fmt == DIGEST:
+                return lambda: self.image_cache.store(key, fmt, data_digest(handle.encoded()))
+            return lambda: self.image_cache.store(key, fmt, encode_image(handle.toImage(), fmt))
+
+        return [job(fmt) for fmt in fmts]
+
+    def document_items(self):
+        """Return the items as ``(type, text or image handle)`` tuples"""
+        return self.snapshot().document_items()
+
+    def load_items(self, items):
+        """Append ``(type, text or handle)`` tuples to the canvas"""
+        for type_, content in items:
+            self.insert_item(len(self.items), type_, content)
+
+    def forget_item(self, item):
+        """Release cached data held for an item that left the canvas"""
+        type_, container, content = item
+        if type_ == 'image':
+            self.image_cache.invalidate(content.cacheKey())
+            self.thumbnails.invalidate(content.cacheKey())
+            # The pixels stay in the store until clear(): snapshots taken
+            # for a running export or the clipboard may still read them
+            if container.widget is not None:
+                self._release(container)
+        else:
+            container.hide()
+            container.deleteLater()
+
+    def clear(self):
+        """Remove every item from the canvas"""
+        for item in self.items:
+            self.forget_item(item)
+        self.items.clear()
+        self._index.clear()
+        self._tops.clear()
+        self._heights.clear()
+        self._row_widths.clear()
+        self._widths.clear()
+        self._resized.clear()
+        self._invalidate(0, 0)
+        self.document.clear()
+        self._stale.clear()
+        self.image_cache.clear()
+        self.thumbnails.clear()
+        self.store.clear()
+        self.cleared.emit()
 
     def remove_selected_item(self):
         """Remove the currently selected item"""
@@ -218,9 +724,6 @@ class CanvasPanel(QWidget):
         action = menu.exec(self.mapToGlobal(event.pos()))
         
         if action == delete_action:
-            # Find the item under the cursor and remove it
-            for i, (_, container, _) in enumerate(self.items):
-                if container.geometry().contains(event.pos()):
-                    self.items.pop(i)
-                    self.update_layout()
-                    break
\ No newline at end of file
+            index = self.item_at(event.pos())
+            if index != -1:
+                self.remove_item(index)
\ No newline at end of file
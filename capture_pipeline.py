@@ -0,0 +1,157 @@
+import queue
+import threading
+import time
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+import image_diff
+from image_encoding import encode_image
+from image_store import STORE_FORMAT, STORE_QUALITY
+from tracing import tracer
+
+# Captures that may be grabbed but not yet stored. Each one holds a full
+# uncompressed frame, so this bounds the pipeline's memory.
+DEFAULT_MAX_PENDING = 4
+STAGES = ('grab', 'convert', 'queue', 'diff', 'encode', 'store')
+
+
+class CaptureTiming:
+    """Milliseconds spent in each pipeline stage for one capture"""
+
+    __slots__ = STAGES + ('width', 'height', 'note')
+
+    def __init__(self, grab=0.0, width=0, height=0):
+        self.grab = grab
+        self.convert = self.queue = self.diff = self.encode = self.store = 0.0
+        self.width = width
+        self.height = height
+        # What the duplicate check concluded, if anything
+        self.note = ''
+
+    def total(self):
+        return sum(getattr(self, stage) for stage in STAGES)
+
+    def summary(self):
+        stages = ', '.join(f"{stage} {getattr(self, stage):.0f} ms" for stage in STAGES)
+        note = f" ({self.note})" if self.note else ''
+        return f"{self.width}x{self.height}{note}: {stages}"
+
+
+class CapturePipeline(QObject):
+    """Move screenshot compression and storage off the GUI thread
+
+    The grab itself and the QPixmap to QImage conversion have to happen on
+    the GUI thread, since QPixmap is not thread-safe. Everything after that
+    runs on a worker thread, which compresses the frame and appends it to
+    the image store, then emits ``captured`` back on the GUI thread in
+    capture order.
+
+    At most ``max_pending`` captures may be in flight. submit() returns
+    False instead of queueing more, so bursts apply backpressure rather than
+    piling up uncompressed frames.
+
+    When NumPy is available each frame is compared with the previous one
+    before encoding. Near-duplicates are flagged, or dropped with
+    ``drop_duplicates``; with ``crop_to_changes`` a frame is reduced to the
+    region that changed since the previous one.
+    """
+
+    captured = pyqtSignal(object, object)   # ImageHandle, CaptureTiming
+    discarded = pyqtSignal(object)          # CaptureTiming of a dropped duplicate
+    failed = pyqtSignal(str)                # Why a capture couldn't be stored
+
+    def __init__(self, store, max_pending=DEFAULT_MAX_PENDING, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.max_pending = max_pending
+        self.last_timing = None
+        self.completed = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.detect_duplicates = image_diff.available()
+        self.drop_duplicates = False
+        self.crop_to_changes = False
+        # Created by the worker on first use, so NumPy loads off the GUI
+        # thread and not at startup
+        self._comparer = None
+        self._queue = queue.Queue()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._thread = threading.Thread(target=self._run, name='capture-pipeline', daemon=True)
+        self._thread.start()
+        self.captured.connect(self._remember_timing)
+
+    def submit(self, pixmap, grab_ms=0.0):
+        """Queue a grabbed pixmap; returns False if the pipeline is full"""
+        if not self._slots.acquire(blocking=False):
+            self.dropped += 1
+            return False
+        timing = CaptureTiming(grab_ms, pixmap.width(), pixmap.height())
+        start = time.perf_counter()
+        image = pixmap.toImage()
+        timing.convert = (time.perf_counter() - start) * 1000
+        tracer.record('capture.convert', start, timing.convert / 1000)
+        self._queue.put((image, timing, time.perf_counter()))
+        return True
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _remember_timing(self, handle, timing):
+        self.last_timing = timing
+        self.completed += 1
+
+    def _compare(self, image, timing):
+        # Returns the image to store (possibly cropped), or None to drop it
+        if not self.detect_duplicates:
+            return image
+        if self._comparer is None:
+            self._comparer = image_diff.CaptureComparer()
+        result = self._comparer.compare(image)
+        if result.duplicate:
+            self.duplicates += 1
+            timing.note = f"near-duplicate, {result.distance} bits apart"
+            if self.drop_duplicates:
+                return None
+        elif self.crop_to_changes:
+            crop = image_diff.crop_rect(image, result.changed)
+            if crop is not None:
+                image = image.copy(crop)
+                timing.width, timing.height = crop.width(), crop.height()
+                timing.note = "cropped to changed region"
+        return image
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            image, timing, queued_at = job
+            try:
+                start = time.perf_counter()
+                timing.queue = (start - queued_at) * 1000
+                image = self._compare(image, timing)
+                compared_at = time.perf_counter()
+                timing.diff = (compared_at - start) * 1000
+                if image is None:
+                    self.discarded.emit(timing)
+                    continue
+                data = encode_image(image, STORE_FORMAT, STORE_QUALITY)
+                encoded_at = time.perf_counter()
+                timing.encode = (encoded_at - compared_at) * 1000
+                handle = self.store.add_encoded(data, image.width(), image.height(), image)
+                timing.store = (time.perf_counter() - encoded_at) * 1000
+                if tracer.enabled:
+                    # The stages were timed anyway; record them as spans
+                    tracer.record('capture.diff', start, compared_at - start)
+                    tracer.record('capture.encode', compared_at, encoded_at - compared_at)
+                    tracer.record('capture.store', encoded_at, timing.store / 1000)
+            except Exception as e:
+                self.failed.emit(f"{type(e).__name__}: {e}")
+                continue
+            finally:
+                self._slots.release()
+            self.captured.emit(handle, timing)
@@ -0,0 +1,105 @@
+import base64
+import json
+
+from PyQt6.QtCore import QByteArray, QMimeData
+
+from html_export import image_block_html, text_block_html
+from ordered_pool import process_in_order
+from tracing import span
+
+TEXT_MIME = 'text/plain'
+HTML_MIME = 'text/html'
+IMAGE_MIME = 'application/x-qt-image'
+# Lossless copy of the blocks for pasting into another Documenta canvas
+FRAGMENT_MIME = 'application/x-documenta-fragment'
+FRAGMENT_VERSION = 1
+IMAGE_PLACEHOLDER = '[Image]'
+
+
+class DocumentMimeData(QMimeData):
+    """Clipboard contents of a document snapshot, rendered only when asked for
+
+    Holding a DocumentSnapshot costs nothing, so copying returns
+    immediately. Each format is produced the first time the paste target
+    requests it, reusing the canvas's cached encodings, and is kept for
+    later requests. HTML and the image follow the snapshot's encoding
+    profile; the fragment always carries the stored, lossless bytes. The
+    clipboard holds a single image, so only the last screenshot is offered
+    as one.
+    """
+
+    def __init__(self, document):
+        super().__init__()
+        self.document = document
+        self.items = document.document_items()
+        self.profile = document.encoding_profile
+        self._rendered = {}
+        self._formats = [TEXT_MIME, HTML_MIME, FRAGMENT_MIME]
+        if any(type_ == 'image' for type_, _ in self.items):
+            self._formats.append(IMAGE_MIME)
+
+    def formats(self):
+        return list(self._formats)
+
+    def hasFormat(self, mime_type):
+        return mime_type in self._formats
+
+    def retrieveData(self, mime_type, preferred_type):
+        if mime_type not in self._formats:
+            return None
+        if mime_type not in self._rendered:
+            render = {TEXT_MIME: self._text, HTML_MIME: self._html,
+                      IMAGE_MIME: self._image, FRAGMENT_MIME: self._fragment}[mime_type]
+            with span('clipboard.render', format=mime_type):
+                self._rendered[mime_type] = render()
+        return self._rendered[mime_type]
+
+    def _text(self):
+        return '\n\n'.join(IMAGE_PLACEHOLDER if type_ == 'image' else content
+                           for type_, content in self.items)
+
+    def _html(self):
+        parts = []
+
+        def prepare(item):
+            type_, content = item
+            if type_ == 'image':
+                encode, = self.document.image_jobs(content, self.profile)
+                return lambda: image_block_html(encode(), self.profile.mime)
+            return text_block_html(type_, content)
+
+        process_in_order(self._live_items(), prepare, parts.append)
+        return ''.join(parts)
+
+    def _image(self):
+        images = [content for type_, content in self._live_items() if type_ == 'image']
+        return self.profile.prepare(images[-1].toImage()) if images else None
+
+    def _fragment(self):
+        blocks = []
+        for type_, content in self._live_items():
+            if type_ == 'image':
+                blocks.append({'type': 'image', 'width': content.width(), 'height': content.height(),
+                               'data': base64.b64encode(content.encoded()).decode('ascii')})
+            else:
+                blocks.append({'type': type_, 'text': content})
+        return QByteArray(json.dumps({'version': FRAGMENT_VERSION, 'items': blocks}).encode('utf-8'))
+
+    def _live_items(self):
+        # Screenshots of a document cleared or closed since the copy are
+        # gone from the image store; leave them out rather than fail the paste
+        return [(type_, content) for type_, content in self.items
+                if type_ != 'image' or self.document.store.contains(content.cacheKey())]
+
+
+def fragment_items(data, store):
+    """Turn FRAGMENT_MIME bytes back into ``(type, text or handle)`` tuples"""
+    fragment = json.loads(bytes(data).decode('utf-8'))
+    items = []
+    for block in fragment['items']:
+        if block['type'] == 'image':
+            items.append(('image', store.add_encoded(
+                base64.b64decode(block['data']), block['width'], block['height'])))
+        else:
+            items.append((block['type'], block['text']))
+    return items
@@ -0,0 +1,107 @@
+import re
+from functools import lru_cache
+from html import escape
+
+# Lines of (text, state) -> tokens kept between edits and exports
+TOKEN_CACHE_LINES = 65536
+
+TOKEN_COLORS = {
+    'keyword': '#0033b3',
+    'string': '#067d17',
+    'comment': '#8c8c8c',
+    'number': '#1750eb',
+}
+
+# A language-neutral set covering Python, the C family and JavaScript,
+# which is what most documentation snippets are
+KEYWORDS = frozenset('''
+    and as assert async await break case catch class const continue def default
+    del do elif else enum except export extends false False final finally for
+    from function global if import in interface is lambda let new None nonlocal
+    not null or pass private protected public raise return self static struct
+    super switch this throw true True try typeof var void while with yield
+'''.split())
+
+TOKEN_RE = re.compile(r'''
+    (?P<comment>\#.*|//.*)
+  | (?P<open>/\*|"""|\'\'\')
+  | (?P<string>"(?:[^"\\]|\\.)*"?|'(?:[^'\\]|\\.)*'?)
+  | (?P<number>\b0[xX][0-9a-fA-F]+\b|\b\d[\d_]*(?:\.\d+)?(?:[eE][+-]?\d+)?\b)
+  | (?P<word>\b[A-Za-z_]\w*\b)
+''', re.VERBOSE)
+
+# Line states for constructs spanning lines, as QSyntaxHighlighter block
+# states: 0 is plain code
+OPENERS = {'/*': 1, '"""': 2, "'''": 3}
+CLOSERS = {1: '*/', 2: '"""', 3: "'''"}
+STATE_KINDS = {1: 'comment', 2: 'string', 3: 'string'}
+
+
+@lru_cache(maxsize=TOKEN_CACHE_LINES)
+def tokenize_line(text, state=0):
+    """Tokenize one line given the state the previous line ended in
+
+    Returns ``(tokens, end_state)`` where tokens is a tuple of
+    ``(start, length, kind)``. Results are memoized, so the editor's
+    highlighter and the exporters tokenize each distinct line only once.
+    """
+    tokens = []
+    pos = 0
+    if state:
+        end = text.find(CLOSERS[state])
+        if end == -1:
+            return ((0, len(text), STATE_KINDS[state]),) if text else (), state
+        pos = end + len(CLOSERS[state])
+        tokens.append((0, pos, STATE_KINDS[state]))
+    while True:
+        match = TOKEN_RE.search(text, pos)
+        if match is None:
+            return tuple(tokens), 0
+        kind = match.lastgroup
+        start = match.start()
+        pos = match.end()
+        if kind == 'open':
+            state = OPENERS[match.group()]
+            end = text.find(CLOSERS[state], pos)
+            if end == -1:
+                tokens.append((start, len(text) - start, STATE_KINDS[state]))
+                return tuple(tokens), state
+            pos = end + len(CLOSERS[state])
+            kind = STATE_KINDS[state]
+        elif kind == 'word':
+            if match.group() not in KEYWORDS:
+                continue
+            kind = 'keyword'
+        tokens.append((start, pos - start, kind))
+
+
+def highlighted_lines(text):
+    """Yield each line of ``text`` as a list of ``(segment, kind or None)``"""
+    state = 0
+    for line in text.split('\n'):
+        tokens, state = tokenize_line(line, state)
+        segments = []
+        pos = 0
+        for start, length, kind in tokens:
+            if start > pos:
+                segments.append((line[pos:start], None))
+            segments.append((line[start:start + length], kind))
+            pos = start + length
+        if pos < len(line):
+            segments.append((line[pos:], None))
+        yield segments
+
+
+def highlight_html(text):
+    """Render code as escaped HTML with inline-styled token spans
+
+    Inline styles rather than classes, so fragments keep their colours
+    when pasted through the clipboard without the exported stylesheet.
+    """
+    lines = []
+    for segments in highlighted_lines(text):
+        lines.append(''.join(
+            escape(segment, quote=False) if kind is None
+            else f'<span style="color: {TOKEN_COLORS[kind]}">{escape(segment, quote=False)}</span>'
+            for segment, kind in segments))
+    return '\n'.join(lines)
@@ -0,0 +1,115 @@
+import itertools
+
+from html_export import AssetWriter, image_asset_html, image_block_html, stream_html, text_block_html
+from image_cache import DIGEST
+
+_next_id = itertools.count(1)
+
+
+class DocumentItem:
+    """One block of a document: its type and its text or image handle
+
+    Records are never changed once created; an edit replaces the record
+    (keeping its id), so any snapshot holding the old one is unaffected.
+    """
+
+    __slots__ = ('id', 'type', 'content')
+
+    def __init__(self, type_, content, item_id=None):
+        self.id = next(_next_id) if item_id is None else item_id
+        self.type = type_
+        self.content = content
+
+    def with_text(self, text):
+        return DocumentItem(self.type, text, self.id)
+
+
+class DocumentModel:
+    """The canvas's items as DocumentItem records, without any widgets
+
+    CanvasPanel keeps it in the same order as its widgets. Taking a
+    snapshot copies the list of references, not the texts or images.
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def insert(self, index, type_, content):
+        item = DocumentItem(type_, content)
+        self.items.insert(index, item)
+        return item
+
+    def pop(self, index):
+        return self.items.pop(index)
+
+    def move(self, source_index, index):
+        self.items.insert(index, self.items.pop(source_index))
+
+    def set_text(self, index, text):
+        item = self.items[index]
+        if item.content != text:
+            self.items[index] = item.with_text(text)
+
+    def clear(self):
+        self.items.clear()
+
+    def snapshot(self, encoding_profile, image_jobs, store):
+        return DocumentSnapshot(tuple(self.items), encoding_profile, image_jobs, store)
+
+
+class DocumentSnapshot:
+    """The document as it was at one moment, safe to read on any thread
+
+    Stands in for the canvas wherever an exporter only reads the document,
+    so exports and the clipboard can render it while editing goes on.
+    ``image_jobs`` is the canvas's CanvasPanel.image_jobs, which shares its
+    encoded image cache; ``store`` is the image store the handles live in.
+    """
+
+    __slots__ = ('items', 'encoding_profile', 'image_jobs', 'store')
+
+    def __init__(self, items, encoding_profile, image_jobs, store):
+        self.items = items
+        self.encoding_profile = encoding_profile
+        self.image_jobs = image_jobs
+        self.store = store
+
+    def __len__(self):
+        return len(self.items)
+
+    def document_items(self):
+        """Return the items as ``(type, text or image handle)`` tuples"""
+        return [(item.type, item.content) for item in self.items]
+
+    def save_as_html(self, filename, progress=None, assets=False):
+        """Save the document as an HTML file
+
+        Screenshots are encoded on a worker pool and every block is streamed
+        to the file in order, so only a few images are held in memory at a
+        time. ``progress(done, total)`` may return False to cancel; the
+        return value is False if the export was cancelled.
+
+        With ``assets=True`` images are written to an ``assets/`` directory
+        next to the file, named by content hash, instead of being inlined.
+        """
+        asset_writer = AssetWriter(filename) if assets else None
+        profile = self.encoding_profile
+
+        def prepare(item):
+            if item.type == 'image':
+                handle = item.content
+                if asset_writer:
+                    # Assets are named after the stored image plus the
+                    # profile, so reuse works without encoding first
+                    digest, encode = self.image_jobs(handle, DIGEST, profile)
+                    width, height = profile.output_size(handle.width(), handle.height())
+                    return lambda: image_asset_html(
+                        asset_writer.write(digest() + profile.suffix, profile.ext, encode), width, height)
+                encode, = self.image_jobs(handle, profile)
+                return lambda: image_block_html(encode(), profile.mime)
+            return text_block_html(item.type, item.content)
+
+        return stream_html(filename, self.items, prepare, progress)
@@ -1,32 +1,118 @@
 from docx import Document
-from docx.shared import Inches
-from PyQt6.QtWidgets import QLabel, QTextEdit
+from docx.enum.style import WD_STYLE_TYPE
+from docx.shared import Pt, RGBColor
 from PyQt6.QtCore import Qt
+import io
+import os
+from code_tokens import TOKEN_COLORS, highlighted_lines
+from image_store import STORE_FORMAT
+from ordered_pool import process_in_order
+from tracing import span
+
+# Resolution images are downscaled to for the page's text width; higher
+# than screen DPI so text in screenshots stays crisp when printed
+EMBED_DPI = 150
+EMU_PER_INCH = 914400
+CODE_STYLE = 'Code'
+# Image formats Word understands; others fall back to STORE_FORMAT
+DOCX_FORMATS = ('PNG', 'JPEG')
 
 class DocxExporter:
-    def __init__(self):
-        self.document = Document()
-        
-    def export(self, canvas, file_path):
-        # Create a new document
+    """Export a canvas or a DocumentSnapshot to a Word document
+
+    Works from document_items(), so it can run on a worker thread against
+    a snapshot while the canvas is edited. Screenshots are prepared on a
+    worker pool: each is downscaled to the page's text width and encoded
+    into an in-memory buffer, so nothing touches the current directory and
+    concurrent exports cannot collide. python-docx itself is not
+    thread-safe, so the document is assembled on the calling thread, in
+    order, as each image becomes ready.
+    """
+
+    def export(self, document, file_path, progress=None, profile=None):
+        """Write ``document`` to ``file_path``; returns False if cancelled
+
+        Images follow ``profile``, by default the document's encoding profile.
+        """
+        profile = profile or document.encoding_profile
+        if profile.fmt not in DOCX_FORMATS:
+            profile = profile.with_format(STORE_FORMAT)
         doc = Document()
-        
-        # Iterate through canvas items
-        for item in canvas.items:
-            if isinstance(item, QLabel):  # Screenshot
-                image = item.pixmap()
-                # Save image temporarily and add to document
-                temp_path = "temp_image.png"
-                image.save(temp_path)
-                doc.add_picture(temp_path, width=Inches(6))
-                import os
-                os.remove(temp_path)
-                
-            elif isinstance(item, QTextEdit):  # Text or code
-                doc.add_paragraph(item.toPlainText())
-            
-            # Add spacing between elements
-            doc.add_paragraph()
-            
-        # Save the document
-        doc.save(file_path)
\ No newline at end of file
+        section = doc.sections[0]
+        text_width = section.page_width - section.left_margin - section.right_margin
+        max_pixels = int(text_width / EMU_PER_INCH * EMBED_DPI)
+        if profile.max_width:
+            max_pixels = min(max_pixels, profile.max_width)
+        code_style = self._code_style(doc)
+
+        def prepare(item):
+            type_, content = item
+            if type_ == 'image':
+                return lambda: ('image', self._image_buffer(content, max_pixels, profile))
+            return item
+
+        def consume(item):
+            type_, content = item
+            with span('docx.add', type=type_):
+                if type_ == 'image':
+                    # Scale to the image's own size at EMBED_DPI, capped at
+                    # the text width
+                    buffer, width = content
+                    doc.add_picture(buffer, width=min(text_width, int(width / EMBED_DPI * EMU_PER_INCH)))
+                elif type_ == 'code':
+                    self._add_code(doc.add_paragraph(style=code_style), content)
+                else:
+                    doc.add_paragraph(content)
+
+                # Add spacing between elements
+                doc.add_paragraph()
+
+        if not process_in_order(document.document_items(), prepare, consume, progress):
+            return False
+
+        # Save next to the target and swap in, so a failed export never
+        # leaves a half-written document behind
+        tmp_path = file_path + '.part'
+        try:
+            with span('docx.save'):
+                doc.save(tmp_path)
+            os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return True
+
+    @staticmethod
+    def _image_buffer(handle, max_pixels, profile):
+        # Runs on a worker thread. Images that already fit are embedded from
+        # the store's compressed bytes without decoding them, unless the
+        # profile asks for another encoding.
+        if handle.width() <= max_pixels and profile.fmt == STORE_FORMAT and not profile.quantize:
+            return io.BytesIO(handle.encoded()), handle.width()
+        image = handle.toImage()
+        if image.width() > max_pixels:
+            image = image.scaledToWidth(max_pixels, Qt.TransformationMode.SmoothTransformation)
+        return io.BytesIO(profile.encode(image)), image.width()
+
+    @staticmethod
+    def _add_code(paragraph, text):
+        # One run per token, coloured like the editor and the HTML export
+        for line_number, segments in enumerate(highlighted_lines(text)):
+            if line_number:
+                paragraph.add_run('\n')
+            for segment, kind in segments:
+                run = paragraph.add_run(segment)
+                if kind is not None:
+                    run.font.color.rgb = RGBColor.from_string(TOKEN_COLORS[kind].lstrip('#'))
+
+    @staticmethod
+    def _code_style(doc):
+        styles = doc.styles
+        if CODE_STYLE in [style.name for style in styles]:
+            return styles[CODE_STYLE]
+        style = styles.add_style(CODE_STYLE, WD_STYLE_TYPE.PARAGRAPH)
+        style.base_style = styles['Normal']
+        style.font.name = 'Courier New'
+        style.font.size = Pt(9)
+        style.paragraph_format.space_after = Pt(0)
+        return style
@@ -0,0 +1,101 @@
+"""Compare the image encoding profiles on a set of screenshots
+
+Reports total output size and encoding time per image for every profile
+in encoding_profile.PROFILES. Without arguments a synthetic sample set of
+UI-like screenshots at common resolutions is used.
+
+    python encoding_benchmark.py [screenshot.png ...] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import time
+
+if not os.environ.get('DISPLAY') and sys.platform.startswith('linux'):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt6.QtCore import QRect, Qt
+from PyQt6.QtGui import QColor, QFont, QGuiApplication, QImage, QPainter
+
+from encoding_profile import PROFILES
+
+SAMPLE_SIZES = [(1920, 1080), (2560, 1440), (3840, 2160)]
+
+
+def sample_screenshot(width, height):
+    """Draw a window-like image: title bar, sidebar, panels and text"""
+    image = QImage(width, height, QImage.Format.Format_RGB32)
+    image.fill(QColor('#f3f3f3'))
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.setRenderHint(QPainter.RenderHint.TextAntialiasing)
+    scale = width / 1920
+    painter.fillRect(0, 0, width, int(40 * scale), QColor('#2b579a'))
+    painter.fillRect(0, int(40 * scale), int(280 * scale), height, QColor('#e6e6e6'))
+    font = QFont('Sans Serif')
+    font.setPixelSize(max(8, int(15 * scale)))
+    painter.setFont(font)
+    line = int(24 * scale)
+    for row, y in enumerate(range(int(60 * scale), height - line, line)):
+        painter.setPen(QColor('#333333'))
+        painter.drawText(int(16 * scale), y, f"Navigation item {row}")
+        painter.setPen(QColor('#1e1e1e') if row % 7 else QColor('#0066cc'))
+        painter.drawText(int(300 * scale), y,
+                         f"{row:4d}  def handle_event(self, event, index={row}):  # lorem ipsum dolor sit amet")
+    painter.setPen(Qt.PenStyle.NoPen)
+    painter.setBrush(QColor(255, 255, 255, 230))
+    painter.drawRoundedRect(QRect(width // 2, height // 3, width // 3, height // 3), 12 * scale, 12 * scale)
+    painter.end()
+    return image
+
+
+def load_samples(paths):
+    if not paths:
+        return [(f"synthetic {w}x{h}", sample_screenshot(w, h)) for w, h in SAMPLE_SIZES]
+    samples = []
+    for path in paths:
+        image = QImage(path)
+        if image.isNull():
+            print(f"skipping {path}: not an image", file=sys.stderr)
+            continue
+        samples.append((os.path.basename(path), image))
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Documenta's image encoding profiles")
+    parser.add_argument('images', nargs='*', help="screenshots to encode (default: synthetic samples)")
+    parser.add_argument('--repeat', type=int, default=3, help="encodings per image, best time is kept")
+    args = parser.parse_args(argv)
+
+    app = QGuiApplication.instance() or QGuiApplication(sys.argv[:1])
+    samples = load_samples(args.images)
+    if not samples:
+        return 1
+    print(f"{len(samples)} images: " + ', '.join(name for name, _ in samples))
+    print(f"{'profile':<24} {'total KB':>10} {'ms/image':>10} {'size':>8}")
+    baseline = None
+    for profile in PROFILES:
+        if not profile.available():
+            print(f"{profile.name:<24} {'unsupported by this Qt build':>30}")
+            continue
+        total_bytes = 0
+        total_ms = 0.0
+        for _, image in samples:
+            best = None
+            for _ in range(max(1, args.repeat)):
+                start = time.perf_counter()
+                data = profile.encode(image)
+                elapsed = (time.perf_counter() - start) * 1000
+                best = elapsed if best is None else min(best, elapsed)
+            total_bytes += len(data)
+            total_ms += best
+        if baseline is None:
+            baseline = total_bytes
+        print(f"{profile.name:<24} {total_bytes / 1024:>10.0f} {total_ms / len(samples):>10.1f} "
+              f"{total_bytes / baseline:>7.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QImage, QImageWriter
+
+import image_diff
+from image_encoding import encode_image
+from image_store import STORE_FORMAT
+from tracing import span
+
+MIME_TYPES = {'PNG': 'image/png', 'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+EXTENSIONS = {'PNG': 'png', 'JPEG': 'jpg', 'WEBP': 'webp'}
+PALETTE_COLORS = 256
+
+
+def format_supported(fmt):
+    return fmt.lower().encode() in [bytes(f) for f in QImageWriter.supportedImageFormats()]
+
+
+def palette_image(image, colors=PALETTE_COLORS):
+    """Reduce an image to an 8-bit palette
+
+    UI screenshots are mostly flat colours, so with NumPy the palette is
+    simply the most frequent colours and every other pixel maps to its
+    nearest entry. Without NumPy Qt's own colour cube and dithering is used.
+    """
+    if not image_diff.available():
+        return image.convertToFormat(QImage.Format.Format_Indexed8,
+                                     Qt.ImageConversionFlag.DiffuseDither)
+    np = image_diff.load()
+    array, image = image_diff.image_array(image)
+    values, counts = np.unique(array, return_counts=True)
+    if len(values) > colors:
+        values = values[np.argsort(counts)[-colors:]]
+    table = [int(value) | 0xFF000000 for value in values]
+    return image.convertToFormat(QImage.Format.Format_Indexed8, table,
+                                 Qt.ImageConversionFlag.ThresholdDither)
+
+
+class EncodingProfile:
+    """How screenshots are encoded for an output
+
+    One profile is shared by HTML export, the clipboard and DOCX export.
+    Images wider than ``max_width`` are downscaled with smooth filtering
+    first; ``quantize`` reduces PNGs to a 256-colour palette. ``quality`` is
+    passed to Qt's writer (-1 for the format's default).
+
+    Profiles are immutable; ``key`` identifies the output in the encoded
+    image cache.
+    """
+
+    __slots__ = ('name', 'fmt', 'quality', 'max_width', 'quantize')
+
+    def __init__(self, name, fmt='PNG', quality=-1, max_width=None, quantize=False):
+        self.name = name
+        self.fmt = fmt
+        self.quality = quality
+        self.max_width = max_width
+        self.quantize = quantize and fmt == 'PNG'
+
+    @property
+    def key(self):
+        return (self.fmt, self.quality, self.max_width, self.quantize)
+
+    @property
+    def mime(self):
+        return MIME_TYPES[self.fmt]
+
+    @property
+    def ext(self):
+        return EXTENSIONS[self.fmt]
+
+    @property
+    def suffix(self):
+        """Asset name suffix; empty for the original-size PNG profile"""
+        if self.passthrough:
+            return ''
+        return f"-{self.fmt.lower()}{self.quality}w{self.max_width or 0}{'p' if self.quantize else ''}"
+
+    @property
+    def passthrough(self):
+        """True if the image store's own bytes already are this encoding"""
+        return self.fmt == STORE_FORMAT and self.max_width is None and not self.quantize
+
+    def available(self):
+        return format_supported(self.fmt)
+
+    def with_format(self, fmt):
+        """Return a copy of this profile writing ``fmt`` instead"""
+        return EncodingProfile(self.name, fmt, self.quality, self.max_width, self.quantize)
+
+    def output_size(self, width, height):
+        if self.max_width is None or width <= self.max_width:
+            return width, height
+        return self.max_width, max(1, round(height * self.max_width / width))
+
+    def prepare(self, image):
+        """Downscale a QImage to this profile's width; safe on worker threads"""
+        if self.max_width is not None and image.width() > self.max_width:
+            with span('image.scale'):
+                image = image.scaledToWidth(self.max_width, Qt.TransformationMode.SmoothTransformation)
+        return image
+
+    def encode(self, image):
+        image = self.prepare(image)
+        if self.quantize:
+            with span('image.quantize'):
+                image = palette_image(image)
+        elif self.fmt == 'JPEG' and image.hasAlphaChannel():
+            image = image.convertToFormat(QImage.Format.Format_RGB32)
+        return encode_image(image, self.fmt, self.quality)
+
+
+# Screenshots are shown at most ~900 CSS px wide in exported HTML; 1920 px
+# keeps them sharp on high-DPI displays
+WEB_MAX_WIDTH = 1920
+
+PROFILES = [
+    EncodingProfile('Original PNG'),
+    EncodingProfile('PNG, 1920 px', 'PNG', 80, WEB_MAX_WIDTH),
+    EncodingProfile('PNG palette, 1920 px', 'PNG', 80, WEB_MAX_WIDTH, quantize=True),
+    EncodingProfile('JPEG 85, 1920 px', 'JPEG', 85, WEB_MAX_WIDTH),
+    EncodingProfile('WebP 80, 1920 px', 'WEBP', 80, WEB_MAX_WIDTH),
+]
+DEFAULT_PROFILE = PROFILES[0]
@@ -0,0 +1,52 @@
+import importlib
+import importlib.util
+
+
+class ExporterSpec:
+    """Where an exporter lives and how it appears in the UI
+
+    Nothing is imported until load() is called, so heavy backends such as
+    python-docx cost nothing until the first export that needs them.
+    """
+
+    __slots__ = ('name', 'label', 'file_filter', 'module', 'attr', 'options', 'requires', '_exporter')
+
+    def __init__(self, name, label, file_filter, module, attr, options=None, requires=()):
+        self.name = name
+        self.label = label
+        self.file_filter = file_filter
+        self.module = module
+        self.attr = attr
+        self.options = options or {}
+        # Third-party packages the backend imports
+        self.requires = requires
+        self._exporter = None
+
+    def available(self):
+        return all(importlib.util.find_spec(package) is not None for package in self.requires)
+
+    def load(self):
+        if self._exporter is None:
+            exporter_class = getattr(importlib.import_module(self.module), self.attr)
+            self._exporter = exporter_class(**self.options)
+        return self._exporter
+
+
+EXPORTERS = {}
+
+
+def register(spec):
+    EXPORTERS[spec.name] = spec
+    return spec
+
+
+def get(name):
+    """Return the exporter registered as ``name``, importing it if needed"""
+    return EXPORTERS[name].load()
+
+
+register(ExporterSpec('html', "HTML", "HTML files (*.html)", 'html_export', 'HtmlExporter'))
+register(ExporterSpec('html_assets', "HTML with Assets Folder", "HTML files (*.html)",
+                      'html_export', 'HtmlExporter', {'assets': True}))
+register(ExporterSpec('docx', "Word", "Word documents (*.docx)", 'docx_exporter', 'DocxExporter',
+                      requires=('docx',)))
@@ -0,0 +1,148 @@
+import base64
+import hashlib
+import os
+import tempfile
+import threading
+from html import escape
+
+from code_tokens import highlight_html
+from ordered_pool import process_in_order
+from tracing import span, tracer
+
+# Bumped whenever the same document would render differently, so
+# batch_export knows its stamps are stale
+RENDER_VERSION = 2
+
+HTML_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>Documenta Export</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; }
+        pre { background-color: #f0f0f0; padding: 10px; border-radius: 5px; }
+        img { max-width: 100%; height: auto; }
+    </style>
+</head>
+<body>
+    """
+
+HTML_TAIL = """
+</body>
+</html>"""
+
+
+def text_block_html(type_, text):
+    """Render a text or code block as an escaped HTML fragment"""
+    if type_ == 'code':
+        return f'<pre style="background-color: #f0f0f0; font-family: \'Courier New\'">{highlight_html(text)}</pre>'
+    return f'<p>{escape(text, quote=False)}</p>'
+
+
+def image_block_html(data, mime='image/png'):
+    """Render encoded image bytes as an inline <img> fragment"""
+    with span('html.base64'):
+        base64_data = base64.b64encode(data).decode('ascii')
+    return f'<img src="data:{mime};base64,{base64_data}">'
+
+
+def image_asset_html(src, width, height):
+    """Render a lazily loaded <img> fragment pointing at a sidecar asset"""
+    if width is None or height is None:
+        return f'<img src="{src}" loading="lazy">'
+    return f'<img src="{src}" loading="lazy" width="{width}" height="{height}">'
+
+
+def data_digest(data):
+    """Return a short hex digest of encoded image bytes, used to name assets"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class AssetWriter:
+    """Write images into a content-addressed ``assets/`` directory
+
+    Files are named after a digest of the image, so a screenshot that
+    appears several times is stored once, and files left by an earlier
+    export are reused without encoding the image again. Safe to call from
+    several worker threads, or processes sharing the directory, at once.
+    """
+
+    def __init__(self, html_filename, dirname='assets'):
+        self.dirname = dirname
+        self.path = os.path.join(os.path.dirname(os.path.abspath(html_filename)), dirname)
+        self.written = 0
+        self.reused = 0
+        self._claimed = set()
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def write(self, digest, ext, encode):
+        """Store an asset unless it already exists and return its relative src
+
+        ``encode`` is only called when the file has to be written.
+        """
+        name = f'{digest}.{ext}'
+        target = os.path.join(self.path, name)
+        with self._lock:
+            claimed = name in self._claimed
+            self._claimed.add(name)
+        if claimed or os.path.exists(target):
+            self.reused += 1
+        else:
+            # Write under a temporary name so an interrupted export never
+            # leaves a truncated asset that later exports would trust; the
+            # name is unique across threads and processes
+            data = encode()
+            with span('asset.write'):
+                fd, tmp_target = tempfile.mkstemp(suffix='.part', prefix=name + '.', dir=self.path)
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(data)
+                    os.replace(tmp_target, target)
+                except BaseException:
+                    if os.path.exists(tmp_target):
+                        os.remove(tmp_target)
+                    raise
+            self.written += 1
+        return f'{self.dirname}/{name}'
+
+
+class HtmlExporter:
+    """Exporter registry adapter for save_as_html of a canvas or DocumentSnapshot"""
+
+    def __init__(self, assets=False):
+        self.assets = assets
+
+    def export(self, document, file_path, progress=None):
+        """Write ``document`` to ``file_path``; returns False if cancelled"""
+        return document.save_as_html(file_path, progress=progress, assets=self.assets)
+
+
+def stream_html(filename, items, prepare, progress=None, max_workers=None):
+    """Write an HTML document block by block
+
+    ``prepare(item)`` returns an HTML fragment or a callable producing one,
+    as for ordered_pool.process_in_order(). Fragments are written in
+    document order as soon as they are ready, so only a few encoded images
+    are held at once. If ``progress`` cancels the export, the partial file
+    is removed and False is returned.
+    """
+    tmp_filename = filename + '.part'
+    completed = False
+    try:
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            f.write(HTML_HEAD)
+
+            def write(fragment):
+                with span('html.write'):
+                    f.write(fragment)
+
+            if not process_in_order(items, prepare, write if tracer.enabled else f.write, progress, max_workers):
+                return False
+            f.write(HTML_TAIL)
+        os.replace(tmp_filename, filename)
+        completed = True
+        return True
+    finally:
+        if not completed and os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
@@ -0,0 +1,180 @@
+import time
+
+from PyQt6.QtCore import QTimer
+from PyQt6.QtGui import QFont, QTextCursor, QTextFrameFormat
+from PyQt6.QtWidgets import QTextBrowser
+
+from html_export import image_asset_html, text_block_html
+
+# Wait this long after the last change before updating, so typing doesn't
+# re-render on every keystroke
+PREVIEW_DEBOUNCE_MS = 150
+# Work done per event loop pass, leaving the rest of a 60 Hz frame for
+# layout and painting; larger changes continue on the next pass
+FRAME_BUDGET_MS = 8
+# Screenshots are shown at most this wide
+PREVIEW_IMAGE_WIDTH = 320
+IMAGE_SCHEME = 'preview'
+
+
+class HtmlPreview(QTextBrowser):
+    """Live preview of the canvas as exported HTML
+
+    Text and code blocks are rendered by the same html_export functions as
+    save_as_html. Screenshots use the assets-mode <img> tag pointing at the
+    canvas's display thumbnails rather than inlining encoded PNGs, so
+    previewing never encodes an image.
+
+    Every block lives in its own frame of the document. On an update the
+    preview compares a canvas snapshot with what it shows and patches only
+    the frames of blocks that were added, removed, moved or edited; image
+    fragments are built once per screenshot shown. Changes are applied within
+    FRAME_BUDGET_MS per event loop pass, so a large document fills in over
+    several frames instead of freezing the window. Nothing is rendered
+    while the preview is hidden.
+    """
+
+    def __init__(self, canvas, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.setOpenLinks(False)
+        self.document().setDefaultFont(QFont('Arial'))
+        # DocumentItem records shown, and the frame of each, in order
+        self._shown = []
+        self._frames = []
+        # Snapshot items being brought into view, and their ids
+        self._target = None
+        self._target_ids = None
+        # cacheKey -> fragment and handle of each screenshot shown
+        self._image_fragments = {}
+        self._handles = {}
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(PREVIEW_DEBOUNCE_MS)
+        self._debounce.timeout.connect(self.refresh)
+        self._next_pass = QTimer(self)
+        self._next_pass.setSingleShot(True)
+        self._next_pass.timeout.connect(self._apply)
+        canvas.item_added.connect(self.schedule)
+        canvas.item_removed.connect(self.schedule)
+        canvas.item_moved.connect(self.schedule)
+        canvas.item_edited.connect(self.schedule)
+        canvas.cleared.connect(self.reset)
+
+    def schedule(self, *args):
+        """Update after PREVIEW_DEBOUNCE_MS without further changes"""
+        if self.isVisible():
+            self._debounce.start()
+
+    def refresh(self):
+        """Start bringing the preview up to date with the canvas"""
+        self._debounce.stop()
+        self._target = self.canvas.snapshot().items
+        self._target_ids = {item.id for item in self._target}
+        self._apply()
+
+    def reset(self):
+        self._debounce.stop()
+        self._next_pass.stop()
+        self.clear()
+        self._shown = []
+        self._frames = []
+        self._target = None
+        self._image_fragments.clear()
+        self._handles.clear()
+        self.schedule()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+
+    def loadResource(self, type_, url):
+        if url.scheme() == IMAGE_SCHEME:
+            handle = self._handles.get(int(url.path()))
+            if handle is not None:
+                return self.canvas.thumbnails.get(handle, min(PREVIEW_IMAGE_WIDTH, handle.width()))
+        return super().loadResource(type_, url)
+
+    def _apply(self):
+        if self._target is None:
+            return
+        deadline = time.perf_counter() + FRAME_BUDGET_MS / 1000
+        target = self._target
+        shown = self._shown
+        i = 0
+        while i < len(target):
+            if time.perf_counter() > deadline:
+                # Items before ``i`` already match and are skipped quickly
+                self._next_pass.start(0)
+                return
+            item = target[i]
+            if i < len(shown) and shown[i] is item:
+                i += 1
+            elif i < len(shown) and shown[i].id == item.id:
+                self._patch(i, item)
+                i += 1
+            elif i < len(shown) and shown[i].id not in self._target_ids:
+                self._remove(i)
+            else:
+                # New here, or moved from further down
+                for j in range(i + 1, len(shown)):
+                    if shown[j].id == item.id:
+                        self._remove(j)
+                        break
+                self._insert(i, item)
+                i += 1
+        while len(shown) > len(target):
+            self._remove(len(shown) - 1)
+        self._target = None
+        self._prune_images()
+
+    def _fragment(self, item):
+        if item.type != 'image':
+            return text_block_html(item.type, item.content)
+        handle = item.content
+        key = handle.cacheKey()
+        fragment = self._image_fragments.get(key)
+        if fragment is None:
+            width = min(PREVIEW_IMAGE_WIDTH, handle.width())
+            height = max(1, round(handle.height() * width / max(1, handle.width())))
+            fragment = image_asset_html(f'{IMAGE_SCHEME}:{key}', width, height)
+            self._image_fragments[key] = fragment
+            self._handles[key] = handle
+        return fragment
+
+    def _prune_images(self):
+        # Forget screenshots no longer shown, so deleted ones aren't kept
+        # alive by their handles
+        keys = {item.content.cacheKey() for item in self._shown if item.type == 'image'}
+        for key in self._image_fragments.keys() - keys:
+            del self._image_fragments[key]
+            del self._handles[key]
+
+    def _insert(self, index, item):
+        cursor = QTextCursor(self.document())
+        if index < len(self._frames):
+            # Just before the frame currently at ``index``
+            cursor.setPosition(self._frames[index].firstPosition() - 1)
+        else:
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+        frame = cursor.insertFrame(QTextFrameFormat())
+        cursor.insertHtml(self._fragment(item))
+        self._frames.insert(index, frame)
+        self._shown.insert(index, item)
+
+    def _patch(self, index, item):
+        frame = self._frames[index]
+        cursor = QTextCursor(self.document())
+        cursor.setPosition(frame.firstPosition())
+        cursor.setPosition(frame.lastPosition(), QTextCursor.MoveMode.KeepAnchor)
+        cursor.insertHtml(self._fragment(item))
+        self._shown[index] = item
+
+    def _remove(self, index):
+        frame = self._frames.pop(index)
+        self._shown.pop(index)
+        cursor = QTextCursor(self.document())
+        # The frame's boundary characters go with it
+        cursor.setPosition(frame.firstPosition() - 1)
+        cursor.setPosition(frame.lastPosition() + 1, QTextCursor.MoveMode.KeepAnchor)
+        cursor.removeSelectedText()
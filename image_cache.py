@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Cache format name for the content digest used to name exported assets
+DIGEST = 'digest'
+
+
+class EncodedImageCache:
+    """LRU cache of encoded screenshot bytes shared by every output path
+
+    Entries are keyed by ``(cache_key, fmt)`` where ``cache_key`` is the
+    pixmap's cacheKey(), which Qt changes whenever the pixels change, and
+    ``fmt`` names the encoding ('PNG', a digest, ...). The cache holds at
+    most ``max_bytes`` of values and may be used from worker threads.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, cache_key, fmt):
+        """Return the cached value or None, counting a hit or a miss"""
+        key = (cache_key, fmt)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def store(self, cache_key, fmt, value):
+        key = (cache_key, fmt)
+        size = len(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size_bytes -= len(old)
+            self._entries[key] = value
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, cache_key):
+        """Drop every encoding of one image"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == cache_key]:
+                self.size_bytes -= len(self._entries.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self.size_bytes,
+        }
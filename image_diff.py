@@ -0,0 +1,135 @@
+import importlib.util
+
+from PyQt6.QtCore import QRect
+from PyQt6.QtGui import QImage
+
+# NumPy is optional and slow to import, so it is only loaded by load(),
+# the first time a frame is compared; without it duplicate detection is
+# simply unavailable
+np = None
+
+# Frames whose 64-bit difference hashes are at most this many bits apart
+# are candidates for being near-duplicates
+HASH_THRESHOLD = 4
+# ...and they are duplicates if less than this fraction of pixels changed
+# (a moving cursor or a blinking caret)
+DUPLICATE_FRACTION = 0.002
+# Only crop when the changed region is smaller than this fraction of the
+# frame; otherwise the context is worth keeping
+CROP_MAX_FRACTION = 0.5
+CROP_MARGIN = 8
+# Frames are sampled down to roughly this width before hashing
+HASH_SAMPLE_WIDTH = 256
+
+
+def available():
+    return np is not None or importlib.util.find_spec('numpy') is not None
+
+
+def load():
+    """Import NumPy; call before any function below"""
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+def image_array(image):
+    """Return a (height, width) uint32 NumPy view of an image's pixels
+
+    Returns the view and the 32-bit QImage it shares its buffer with; keep
+    that image alive as long as the view. Other formats are converted first.
+    """
+    if image.format() not in (QImage.Format.Format_RGB32, QImage.Format.Format_ARGB32,
+                              QImage.Format.Format_ARGB32_Premultiplied):
+        image = image.convertToFormat(QImage.Format.Format_RGB32)
+    pixels = image.constBits()
+    pixels.setsize(image.sizeInBytes())
+    array = np.frombuffer(pixels, dtype=np.uint32)
+    array = array.reshape(image.height(), image.bytesPerLine() // 4)
+    return array[:, :image.width()], image
+
+
+def difference_hash(array):
+    """64-bit dHash of a uint32 pixel array"""
+    step = max(1, array.shape[1] // HASH_SAMPLE_WIDTH)
+    sample = array[::step, ::step]
+    gray = (((sample >> 16) & 0xFF) * 299 + ((sample >> 8) & 0xFF) * 587
+            + (sample & 0xFF) * 114) // 1000
+    # Block means on an 8x9 grid, then compare horizontal neighbours
+    height, width = (gray.shape[0] // 8) * 8, (gray.shape[1] // 9) * 9
+    if height == 0 or width == 0:
+        return 0
+    grid = gray[:height, :width].reshape(8, height // 8, 9, width // 9).mean(axis=(1, 3))
+    bits = (grid[:, 1:] > grid[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def changed_region(previous, current):
+    """Return (QRect of changed pixels, changed fraction) of two same-size arrays"""
+    diff = previous != current
+    rows = np.flatnonzero(diff.any(axis=1))
+    if rows.size == 0:
+        return QRect(), 0.0
+    cols = np.flatnonzero(diff.any(axis=0))
+    fraction = np.count_nonzero(diff) / diff.size
+    return QRect(int(cols[0]), int(rows[0]),
+                 int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1)), fraction
+
+
+class CaptureComparison:
+    __slots__ = ('duplicate', 'changed', 'distance')
+
+    def __init__(self, duplicate=False, changed=None, distance=None):
+        self.duplicate = duplicate
+        self.changed = changed
+        self.distance = distance
+
+
+class CaptureComparer:
+    """Compare each capture with the previous one
+
+    Consecutive frames of the same size are compared by perceptual hash and
+    by an exact, vectorised pixel diff. compare() reports whether the new
+    frame is a near-duplicate and which rectangle changed.
+    """
+
+    def __init__(self):
+        load()
+        self._previous = None
+        self._previous_hash = None
+        self._previous_image = None
+
+    def reset(self):
+        self._previous = self._previous_hash = self._previous_image = None
+
+    def compare(self, image):
+        array, image = image_array(image)
+        frame_hash = difference_hash(array)
+        result = CaptureComparison()
+        if self._previous is not None and self._previous.shape == array.shape:
+            result.distance = hamming(frame_hash, self._previous_hash)
+            changed, fraction = changed_region(self._previous, array)
+            result.changed = changed
+            result.duplicate = result.distance <= HASH_THRESHOLD and fraction < DUPLICATE_FRACTION
+        if not result.duplicate:
+            # Keep comparing against the last distinct frame so slow drift
+            # through several near-duplicates is still noticed
+            self._previous, self._previous_hash, self._previous_image = array, frame_hash, image
+        return result
+
+
+def crop_rect(image, changed):
+    """Return the padded changed rectangle worth cropping to, or None"""
+    if changed is None or changed.isEmpty():
+        return None
+    area = image.width() * image.height()
+    if changed.width() * changed.height() > area * CROP_MAX_FRACTION:
+        return None
+    padded = changed.adjusted(-CROP_MARGIN, -CROP_MARGIN, CROP_MARGIN, CROP_MARGIN)
+    return padded.intersected(image.rect())
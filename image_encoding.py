@@ -0,0 +1,18 @@
+from PyQt6.QtCore import QBuffer, QIODevice
+
+from tracing import span
+
+
+def encode_image(image, fmt='PNG', quality=-1):
+    """Encode a QImage and return the raw bytes
+
+    Only QImage is safe to use outside the GUI thread, so callers that run
+    this on a worker must convert pixmaps with toImage() first.
+    """
+    with span('image.encode', fmt=fmt):
+        buffer = QBuffer()
+        buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+        image.save(buffer, fmt, quality)
+        data = buffer.data().data()
+        buffer.close()
+    return data
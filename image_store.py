@@ -0,0 +1,269 @@
+import itertools
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt6.QtGui import QImage, QPixmap
+
+from image_encoding import encode_image
+from tracing import span
+
+# Format captures are compressed to in the spill file. Exporting PNG can
+# hand these bytes out as they are.
+STORE_FORMAT = 'PNG'
+# For PNG a high quality value selects a low zlib level; on screenshots this
+# is about twice as fast as the default and rarely any larger
+STORE_QUALITY = 80
+DEFAULT_WORKING_SET_BYTES = 256 * 1024 * 1024
+
+# Handle keys are unique across stores so they can double as cache keys
+_next_key = itertools.count(1)
+
+
+class ImageHandle:
+    """Reference to a screenshot held by an ImageStore
+
+    Handles are cheap, immutable and safe to pass to worker threads. They
+    mimic the parts of the QPixmap API the canvas and exporters use, so the
+    pixels are only decoded when somebody actually asks for them.
+    """
+
+    __slots__ = ('store', 'key', '_width', '_height')
+
+    def __init__(self, store, key, width, height):
+        self.store = store
+        self.key = key
+        self._width = width
+        self._height = height
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def isNull(self):
+        return self._width == 0 or self._height == 0
+
+    def cacheKey(self):
+        return self.key
+
+    def toImage(self):
+        """Return the decoded QImage (any thread)"""
+        return self.store.image(self.key)
+
+    def encoded(self):
+        """Return the compressed bytes in STORE_FORMAT (any thread)"""
+        return self.store.encoded(self.key)
+
+
+class SpillFile:
+    """Append-only anonymous temporary file of compressed images"""
+
+    def __init__(self, dirname=None):
+        self.size = 0
+        self._file = tempfile.TemporaryFile(prefix='documenta-', suffix='.spill', dir=dirname)
+        self._lock = threading.Lock()
+
+    def append(self, data):
+        """Write ``data`` and return the reference to pass to read()"""
+        with self._lock:
+            offset = self.size
+            self._file.seek(offset)
+            self._file.write(data)
+            self.size += len(data)
+        return (offset, len(data))
+
+    def read(self, ref):
+        offset, length = ref
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def truncate(self):
+        with self._lock:
+            self._file.truncate(0)
+            self.size = 0
+
+    def close(self):
+        self._file.close()
+
+
+class ImageStore:
+    """Screenshot storage with a bounded set of decoded images in memory
+
+    Every image added is compressed on a background thread and appended to
+    an anonymous spill file on disk. Decoded QImages are kept in an LRU
+    working set of at most ``working_set_bytes``; anything evicted is decoded
+    again from disk when it is next needed. Images whose spill has not
+    finished yet are never evicted.
+
+    Images can also live in another file, such as an open project; see
+    add_external().
+    """
+
+    def __init__(self, working_set_bytes=DEFAULT_WORKING_SET_BYTES, spill_dir=None):
+        self.working_set_bytes = working_set_bytes
+        self.decoded_bytes = 0
+        self.decodes = 0
+        self._spill = SpillFile(spill_dir)
+        self._index = {}
+        self._pending = {}
+        self._decoded = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, min(4, os.cpu_count() or 1)),
+                                            thread_name_prefix='image-spill')
+
+    def add(self, image):
+        """Store a QImage (or QPixmap, on the GUI thread) and return a handle"""
+        if isinstance(image, QPixmap):
+            image = image.toImage()
+        key = next(_next_key)
+        with self._lock:
+            self._remember(key, image)
+            self._pending[key] = self._executor.submit(self._write, key, image)
+        return ImageHandle(self, key, image.width(), image.height())
+
+    def add_encoded(self, data, width, height, image=None):
+        """Store bytes already compressed in STORE_FORMAT
+
+        The bytes are written to the spill file on the calling thread, so
+        a producer that compresses on its own worker can bound how much is
+        in flight. ``image``, if given, seeds the decoded working set.
+        """
+        key = next(_next_key)
+        ref = self._spill.append(data)
+        with self._lock:
+            self._index[key] = (self._spill, ref)
+            if image is not None:
+                self._remember(key, image)
+        return ImageHandle(self, key, width, height)
+
+    def add_external(self, source, ref, width, height):
+        """Register an image that already exists elsewhere in STORE_FORMAT
+
+        ``source.read(ref)`` must return the compressed bytes from any
+        thread. Nothing is read or decoded until the pixels are needed.
+        """
+        key = next(_next_key)
+        with self._lock:
+            self._index[key] = (source, ref)
+        return ImageHandle(self, key, width, height)
+
+    def image(self, key):
+        with self._lock:
+            image = self._decoded.get(key)
+            if image is not None:
+                self._decoded.move_to_end(key)
+                return image
+        data = self.encoded(key)
+        with span('store.decode'):
+            image = QImage.fromData(data, STORE_FORMAT)
+        with self._lock:
+            self.decodes += 1
+            if key in self._index:
+                self._remember(key, image)
+        return image
+
+    def encoded(self, key):
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            pending.result()
+        with self._lock:
+            source, ref = self._index[key]
+        with span('store.read'):
+            return source.read(ref)
+
+    def rehome(self, source, target=None):
+        """Move images read from ``source`` to ``target`` or the spill file
+
+        Images ``target.has(ref)`` confirms are read from ``target`` with
+        the same ref from now on; the rest are copied into the spill file.
+        Returns ``{key: ref}`` of the images moved to ``target``. Afterwards
+        ``source`` is no longer read.
+        """
+        with self._lock:
+            entries = [(key, ref) for key, (src, ref) in self._index.items() if src is source]
+        moved = {}
+        for key, ref in entries:
+            if target is not None and target.has(ref):
+                entry = (target, ref)
+                moved[key] = ref
+            else:
+                entry = (self._spill, self._spill.append(source.read(ref)))
+            with self._lock:
+                if key in self._index:
+                    self._index[key] = entry
+        return moved
+
+    def contains(self, key):
+        with self._lock:
+            return key in self._index or key in self._pending
+
+    def discard(self, key):
+        """Forget an image; its spill space is reclaimed by clear()"""
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            pending.result()
+        with self._lock:
+            self._index.pop(key, None)
+            image = self._decoded.pop(key, None)
+            if image is not None:
+                self.decoded_bytes -= image.sizeInBytes()
+
+    def clear(self):
+        # Copied under the lock, since spill workers remove their entries;
+        # waited on outside it, since they need it to finish
+        with self._lock:
+            pending = list(self._pending.values())
+        for future in pending:
+            future.result()
+        with self._lock:
+            self._index.clear()
+            self._decoded.clear()
+            self.decoded_bytes = 0
+            self._spill.truncate()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._spill.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'images': len(self._index) + len(self._pending),
+                'decoded': len(self._decoded),
+                'decoded_bytes': self.decoded_bytes,
+                'spilled_bytes': self._spill.size,
+                'decodes': self.decodes,
+            }
+
+    def _write(self, key, image):
+        with span('store.spill'):
+            ref = self._spill.append(encode_image(image, STORE_FORMAT, STORE_QUALITY))
+        with self._lock:
+            self._index[key] = (self._spill, ref)
+            del self._pending[key]
+            self._evict()
+
+    def _remember(self, key, image):
+        # Called with the lock held
+        old = self._decoded.pop(key, None)
+        if old is not None:
+            self.decoded_bytes -= old.sizeInBytes()
+        self._decoded[key] = image
+        self.decoded_bytes += image.sizeInBytes()
+        self._evict()
+
+    def _evict(self):
+        # Called with the lock held; unspilled images stay pinned
+        for key in list(self._decoded):
+            if self.decoded_bytes <= self.working_set_bytes:
+                break
+            if key in self._pending:
+                continue
+            self.decoded_bytes -= self._decoded.pop(key).sizeInBytes()
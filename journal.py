@@ -0,0 +1,360 @@
+import json
+import os
+import queue
+import threading
+
+from PyQt6.QtCore import QLockFile, QObject, QTimer, pyqtSignal
+
+from html_export import data_digest
+
+DEFAULT_JOURNAL_DIR = os.environ.get(
+    'DOCUMENTA_JOURNAL_DIR', os.path.join(os.path.expanduser('~'), '.documenta', 'journal'))
+JOURNAL_NAME = 'journal.log'
+BLOB_DIR = 'blobs'
+# Held by the window journaling into the directory
+LOCK_NAME = 'journal.lock'
+# Text edits are written at most this often per burst of typing
+TEXT_DEBOUNCE_MS = 1000
+# Rewrite the journal as a snapshot of the current document after this
+# many records, so replay time stays bounded
+COMPACT_RECORDS = 500
+
+
+class JournalBlobs:
+    """Image source reading journaled screenshots back for the image store"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self, digest):
+        with open(os.path.join(self.path, digest), 'rb') as f:
+            return f.read()
+
+
+class Journal(QObject):
+    """Append-only autosave journal of canvas mutations
+
+    The GUI thread only turns CanvasPanel signals into small records and
+    queues them; a background thread writes them to ``journal.log`` as JSON
+    lines. Screenshots are written once each to ``blobs/`` under their
+    content digest. Text edits are coalesced per item and written after a
+    pause in typing. Every COMPACT_RECORDS records the log is replaced by a
+    snapshot of the current document and unreferenced blobs are removed.
+
+    A journal that is still on disk at startup means the previous session
+    did not exit cleanly; recover() reads it back. Only one window at a
+    time journals into a directory; see acquire(). If writing fails, e.g.
+    because the directory went away, ``failed`` is emitted and journaling
+    stops.
+    """
+    failed = pyqtSignal(str)    # Why the journal can no longer be written
+
+    def __init__(self, path=DEFAULT_JOURNAL_DIR, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.log_path = os.path.join(path, JOURNAL_NAME)
+        self.blobs = JournalBlobs(os.path.join(path, BLOB_DIR))
+        self.canvas = None
+        self._ids = {}
+        self._next_id = 1
+        self._records = 0
+        self._dirty = {}
+        # Handles recover() created, which read their blobs lazily, and the
+        # store they live in
+        self._recovered = {}
+        self._store = None
+        # Set once the writer has failed; nothing is queued after that
+        self._stopped = False
+        self._lock = QLockFile(os.path.join(path, LOCK_NAME))
+        # A stale lock is taken over right away
+        self._lock.setStaleLockTime(0)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._text_timer = QTimer(self)
+        self._text_timer.setSingleShot(True)
+        self._text_timer.setInterval(TEXT_DEBOUNCE_MS)
+        self._text_timer.timeout.connect(self._on_text_timer)
+        # Emitted by the writer thread, handled on the GUI thread
+        self.failed.connect(self._on_failed)
+
+    def acquire(self):
+        """Take the directory's lock; False if another window holds it
+
+        A second window must neither recover nor delete a journal that is
+        still being written.
+        """
+        if self._lock.isLocked():
+            return True
+        os.makedirs(self.path, exist_ok=True)
+        return self._lock.tryLock(0)
+
+    def has_recovery(self):
+        return os.path.exists(self.log_path) and os.path.getsize(self.log_path) > 0
+
+    def recover(self, store):
+        """Replay the journal left by a previous session
+
+        Returns ``(type, text or handle)`` tuples for CanvasPanel.load_items;
+        screenshots are read lazily from the blob directory through
+        ``store``. A torn final record is ignored.
+        """
+        order = []
+        items = {}
+        with open(self.log_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                op = record['op']
+                if op == 'add':
+                    items[record['id']] = record
+                    order.insert(min(record['index'], len(order)), record['id'])
+                elif op == 'remove':
+                    if record['id'] in items:
+                        order.remove(record['id'])
+                        del items[record['id']]
+                elif op == 'move':
+                    if record['id'] in items:
+                        order.remove(record['id'])
+                        order.insert(min(record['index'], len(order)), record['id'])
+                elif op == 'text':
+                    if record['id'] in items:
+                        items[record['id']]['text'] = record['text']
+                elif op == 'clear':
+                    order.clear()
+                    items.clear()
+
+        recovered = []
+        self._store = store
+        for item_id in order:
+            record = items[item_id]
+            if record['type'] == 'image':
+                if record.get('blob') is None:
+                    continue
+                handle = store.add_external(self.blobs, record['blob'], record['width'], record['height'])
+                self._recovered[handle.key] = record['blob']
+                recovered.append(('image', handle))
+            else:
+                recovered.append((record['type'], record.get('text', '')))
+        return recovered
+
+    def start(self, canvas):
+        """Start journaling ``canvas``, replacing any previous journal
+
+        The current canvas content is written as the first snapshot, so
+        anything recovered just before is kept.
+        """
+        os.makedirs(self.blobs.path, exist_ok=True)
+        self.canvas = canvas
+        self._thread = threading.Thread(target=self._run, name='journal-writer', daemon=True)
+        self._thread.start()
+        self.compact()
+        canvas.item_added.connect(self._on_added)
+        canvas.item_removed.connect(self._on_removed)
+        canvas.item_moved.connect(self._on_moved)
+        canvas.item_edited.connect(self._on_edited)
+        canvas.cleared.connect(self._on_cleared)
+
+    def close(self, discard=True):
+        """Stop the writer; a clean exit discards the journal"""
+        if self._thread is not None:
+            self.flush_text()
+            self._queue.put(('close', discard))
+            self._thread.join()
+            self._thread = None
+        if self._lock.isLocked():
+            self._lock.unlock()
+
+    def flush_text(self):
+        """Write the latest text of every item edited since the last flush"""
+        self._text_timer.stop()
+        dirty, self._dirty = self._dirty, {}
+        if self._stopped:
+            return
+        for item_id, editor in dirty.items():
+            self._put({'op': 'text', 'id': item_id, 'text': editor.toPlainText()})
+
+    def compact(self):
+        """Replace the log with a snapshot of the current document"""
+        self.flush_text()
+        if self._stopped:
+            return
+        snapshot = []
+        for index, item in enumerate(self.canvas.items):
+            snapshot.append(self._add_record(item, index))
+        self._records = 0
+        # Recovered screenshots removed from the canvas may come back
+        # through undo, so their blobs must survive the snapshot
+        keep = {digest for key, digest in self._recovered.items() if self._store.contains(key)}
+        self._queue.put(('snapshot', (snapshot, keep)))
+
+    def _put(self, record):
+        if self._stopped:
+            return
+        self._queue.put(('record', record))
+        self._records += 1
+
+    def _compact_if_due(self):
+        # Only called once a change's records are all queued, so the
+        # snapshot never precedes a record of the state it already holds
+        if self._records >= COMPACT_RECORDS:
+            self.compact()
+
+    def _on_text_timer(self):
+        self.flush_text()
+        self._compact_if_due()
+
+    def _add_record(self, item, index):
+        type_, container, content = item
+        # Ids survive compaction so records already queued stay valid
+        tracked = self._ids.get(container)
+        if tracked is None:
+            tracked = self._ids[container] = (self._next_id, content)
+            self._next_id += 1
+        item_id = tracked[0]
+        record = {'op': 'add', 'id': item_id, 'index': index, 'type': type_}
+        if type_ == 'image':
+            # The writer thread resolves the handle to a blob
+            record['handle'] = content
+        else:
+            record['text'] = content.toPlainText()
+        return record
+
+    def _on_added(self, index):
+        self.flush_text()
+        self._put(self._add_record(self.canvas.items[index], index))
+        self._compact_if_due()
+
+    def _on_removed(self, index, item):
+        self.flush_text()
+        tracked = self._ids.pop(item[1], None)
+        if tracked is not None:
+            self._put({'op': 'remove', 'id': tracked[0]})
+        self._compact_if_due()
+
+    def _on_moved(self, old_index, new_index):
+        self.flush_text()
+        container = self.canvas.items[new_index][1]
+        self._put({'op': 'move', 'id': self._ids[container][0], 'index': new_index})
+        self._compact_if_due()
+
+    def _on_edited(self, container):
+        tracked = self._ids.get(container)
+        if tracked is None:
+            return
+        item_id, editor = tracked
+        self._dirty[item_id] = editor
+        if not self._text_timer.isActive():
+            self._text_timer.start()
+
+    def _on_cleared(self):
+        self._dirty.clear()
+        self._ids.clear()
+        self._recovered.clear()
+        self._put({'op': 'clear'})
+        self._compact_if_due()
+
+    def _on_failed(self, message):
+        # The writer skips everything but close from now on, so stop
+        # following the canvas instead of queueing records without limit
+        self._stopped = True
+        self._text_timer.stop()
+        self._dirty.clear()
+        if self.canvas is not None:
+            self.canvas.item_added.disconnect(self._on_added)
+            self.canvas.item_removed.disconnect(self._on_removed)
+            self.canvas.item_moved.disconnect(self._on_moved)
+            self.canvas.item_edited.disconnect(self._on_edited)
+            self.canvas.cleared.disconnect(self._on_cleared)
+
+    # Everything below runs on the writer thread
+
+    def _run(self):
+        digests = {}
+        log = None
+        failed = False
+        while True:
+            command, payload = self._queue.get()
+            if command == 'close':
+                try:
+                    if log is not None:
+                        log.close()
+                    if payload:
+                        self._remove_all()
+                except OSError:
+                    # Nobody is left to tell; the next session offers to
+                    # recover whatever remains
+                    pass
+                return
+            if failed:
+                # Only a close is still waited for
+                continue
+            try:
+                if command == 'snapshot':
+                    if log is not None:
+                        log.close()
+                        log = None
+                    log = self._write_snapshot(payload, digests)
+                    continue
+                log.write(self._encode(payload, digests))
+                if self._queue.empty():
+                    # Batch the flush and fsync with whatever arrived together
+                    log.flush()
+                    os.fsync(log.fileno())
+            except Exception as e:
+                failed = True
+                self.failed.emit(f"{type(e).__name__}: {e}")
+
+    def _encode(self, record, digests):
+        handle = record.pop('handle', None)
+        if handle is not None:
+            record['width'] = handle.width()
+            record['height'] = handle.height()
+            record['blob'] = self._write_blob(handle, digests)
+        return json.dumps(record) + '\n'
+
+    def _write_blob(self, handle, digests):
+        digest = digests.get(handle.key)
+        if digest is not None:
+            return digest
+        try:
+            data = handle.encoded()
+        except Exception:
+            if handle.store.contains(handle.key):
+                raise
+            # Removed from the store, and perhaps its file closed, before
+            # we got to it; a remove or clear record follows
+            return None
+        digest = data_digest(data)
+        target = os.path.join(self.blobs.path, digest)
+        if not os.path.exists(target):
+            with open(target + '.part', 'wb') as f:
+                f.write(data)
+            os.replace(target + '.part', target)
+        digests[handle.key] = digest
+        return digest
+
+    def _write_snapshot(self, snapshot, digests):
+        records, keep = snapshot
+        tmp_path = self.log_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(self._encode(record, digests))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.log_path)
+        live = {record.get('blob') for record in records} | keep
+        for name in os.listdir(self.blobs.path):
+            if name not in live:
+                os.remove(os.path.join(self.blobs.path, name))
+        for key in [key for key, digest in digests.items() if digest not in live]:
+            del digests[key]
+        return open(self.log_path, 'a', encoding='utf-8')
+
+    def _remove_all(self):
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        if os.path.isdir(self.blobs.path):
+            for name in os.listdir(self.blobs.path):
+                os.remove(os.path.join(self.blobs.path, name))
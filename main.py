@@ -1,12 +1,32 @@
+import time
+STARTED = time.perf_counter()
+
 import sys
+from PyQt6.QtCore import QTimer
 from PyQt6.QtWidgets import QApplication
 from main_window import MainWindow
+IMPORTED = time.perf_counter()
+
+def report_startup(app, window, constructed):
+    # Milliseconds since main.py started executing, per startup phase
+    finished = time.perf_counter()
+    phases = [("imports", IMPORTED), ("window constructed", constructed),
+              ("first paint", window.first_paint_at), ("deferred setup", finished)]
+    for name, at in phases:
+        print(f"{name:<20} {(at - STARTED) * 1000:8.1f} ms", file=sys.stderr)
+    QTimer.singleShot(0, app.quit)
 
 def main():
+    # --startup-time prints how long each startup phase took and exits,
+    # without touching the autosave journal
+    measure = '--startup-time' in sys.argv
     app = QApplication(sys.argv)
-    window = MainWindow()
+    window = MainWindow(journal=not measure)
+    if measure:
+        constructed = time.perf_counter()
+        window.startup_finished.connect(lambda: report_startup(app, window, constructed))
     window.show()
     sys.exit(app.exec())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
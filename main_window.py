@@ -1,22 +1,102 @@
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                            QPushButton, QFileDialog, QScrollArea, QApplication,
-                           QMessageBox)
-from PyQt6.QtCore import Qt, QBuffer
-from PyQt6.QtGui import QAction
+                           QMessageBox, QProgressDialog, QInputDialog, QLabel,
+                           QDockWidget)
+from PyQt6.QtCore import Qt, QBuffer, QObject, QTimer, pyqtSignal
+from PyQt6.QtGui import QAction, QActionGroup, QKeySequence
 from canvas_panel import CanvasPanel
 from keybindings import KeybindingsManager
 from screenshot import ScreenshotTool
-from docx_exporter import DocxExporter
-import pyperclip
+from encoding_profile import PROFILES
+from html_preview import HtmlPreview
+from project_file import ProjectFile
+from journal import Journal
+from tracing import operation, tracer
+from undo_stack import UndoStack
+import exporters
+import image_diff
+import os
+import threading
+import time
+
+class ExportProgressDialog(QProgressDialog):
+    """Non-modal progress of a background export; editing carries on"""
+
+    def __init__(self, label, total, parent=None):
+        super().__init__(label, "Cancel", 0, total, parent)
+        self.setWindowTitle("Documenta")
+        self.setWindowModality(Qt.WindowModality.NonModal)
+        self.setMinimumDuration(500)
+
+    def report(self, done, total):
+        self.setMaximum(total)
+        self.setValue(done)
+
+class ExportJob(QObject):
+    """Run an exporter against a document snapshot on a worker thread
+
+    Signals are delivered on the GUI thread.
+    """
+    progressed = pyqtSignal(int, int)
+    finished = pyqtSignal(bool)     # False if cancelled
+    failed = pyqtSignal(str)
+
+    def __init__(self, exporter, document, file_path, label, parent=None):
+        super().__init__(parent)
+        self.exporter = exporter
+        self.document = document
+        self.file_path = file_path
+        self.label = label
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._run, name='export', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled = True
+
+    def wait(self):
+        self._thread.join()
+
+    def _progress(self, done, total):
+        self.progressed.emit(done, total)
+        return not self._cancelled
+
+    def _run(self):
+        try:
+            with operation(f"Export {self.label}"):
+                completed = self.exporter.export(self.document, self.file_path, progress=self._progress)
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.finished.emit(completed)
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    # Emitted once the setup deferred past the first paint is done
+    startup_finished = pyqtSignal()
+    # Relays tracer summaries, which may come from an export thread
+    trace_summary = pyqtSignal(object)
+
+    def __init__(self, journal=True):
         super().__init__()
         self.setWindowTitle("Document Composer")
         self.setGeometry(100, 100, 800, 600)
         
         # Create status bar
         self.statusBar().showMessage("Ready")
+        # Breakdown of the last traced operation, while tracing is on
+        self.trace_label = QLabel()
+        self.trace_label.setVisible(tracer.enabled)
+        self.statusBar().addPermanentWidget(self.trace_label)
+        self.trace_summary.connect(lambda summary: self.trace_label.setText(summary.text()))
+        tracer.listeners.append(self.trace_summary.emit)
+        
+        # Exports running in the background
+        self.export_jobs = []
+        
+        # Open .docproj file, if any
+        self.project = None
         
         # Main widget and layout
         main_widget = QWidget()
@@ -32,11 +112,35 @@ class MainWindow(QMainWindow):
         self.canvas = CanvasPanel()
         scroll_area.setWidget(self.canvas)
         
-        # Initialize screenshot tool first
-        self.screenshot_tool = ScreenshotTool(self.canvas)
+        # Live HTML preview; hidden until opened from the View menu, and
+        # idle while hidden
+        self.preview = HtmlPreview(self.canvas)
+        self.preview_dock = QDockWidget("HTML Preview", self)
+        self.preview_dock.setObjectName("preview_dock")
+        self.preview_dock.setWidget(self.preview)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.preview_dock)
+        self.preview_dock.hide()
+        
+        # Undo history, with its size shown in the status bar
+        self.undo_stack = UndoStack(self.canvas, parent=self)
+        # Screenshots dropped from the history, waiting for running exports
+        # to finish before they're taken out of the image store
+        self._released_images = []
+        self.undo_stack.released.connect(self.release_images)
+        self.history_label = QLabel()
+        self.statusBar().addPermanentWidget(self.history_label)
+        
+        # The screenshot tool and shortcuts aren't needed to show the
+        # window; finish_startup() creates them right after the first paint
+        self.screenshot_tool = None
+        self.keybindings = None
+        self.first_paint_at = None
+        self._startup_done = False
         
-        # Create menu bar (after screenshot_tool is initialized)
+        # Menu actions reach the screenshot tool through capture_tool()
         self.create_menu_bar()
+        self.undo_stack.changed.connect(self.update_history)
+        self.update_history()
         
         # Buttons layout
         button_layout = QHBoxLayout()
@@ -59,47 +163,207 @@ class MainWindow(QMainWindow):
         # Add button layout to main layout
         layout.addLayout(button_layout)
         
-        # Initialize keybindings after screenshot tool
+        # Autosave journal; started, with an offer to recover, once the
+        # window is visible
+        self.journal = Journal(parent=self)
+        self.journal.failed.connect(
+            lambda error: self.statusBar().showMessage(f"Autosave stopped, crash recovery is off: {error}"))
+        self.journal_enabled = journal
+    
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_paint_at is None:
+            self.first_paint_at = time.perf_counter()
+            QTimer.singleShot(0, self.finish_startup)
+    
+    def finish_startup(self):
+        """Create what the first frame doesn't need; later calls do nothing"""
+        if self._startup_done:
+            return
+        self._startup_done = True
+        self.screenshot_tool = ScreenshotTool(self.canvas)
+        self.screenshot_tool.status_message.connect(
+            lambda message: self.statusBar().showMessage(message, 3000))
         self.keybindings = KeybindingsManager(self)
+        self.startup_finished.emit()
+        if self.journal_enabled:
+            self.start_journal()
+    
+    def capture_tool(self):
+        """Return the screenshot tool, creating it if startup hasn't yet"""
+        self.finish_startup()
+        return self.screenshot_tool
+    
+    def start_journal(self):
+        """Offer to restore a crashed session, then start journaling"""
+        if not self.journal.acquire():
+            # Its journal belongs to the window that holds the lock
+            self.statusBar().showMessage("Another Documenta window is autosaving; this one is not journaled", 5000)
+            return
+        if self.journal.has_recovery():
+            reply = QMessageBox.question(self, "Recover Session",
+                                        "Documenta did not shut down cleanly. Restore the unsaved document?",
+                                        QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+            if reply == QMessageBox.StandardButton.Yes:
+                try:
+                    self.canvas.load_items(self.journal.recover(self.canvas.store))
+                    self.undo_stack.clear()
+                    self.statusBar().showMessage("Session recovered", 2000)
+                except Exception as e:
+                    QMessageBox.warning(self, "Recovery Failed", f"Failed to recover session: {str(e)}")
+        self.journal.start(self.canvas)
+    
+    def closeEvent(self, event):
+        # Exports write to a temporary file, so cancelling leaves nothing
+        # half-written behind
+        for job in self.export_jobs:
+            job.cancel()
+        self.wait_for_exports()
+        if self._startup_done:
+            self.screenshot_tool.shutdown()
+        # A clean exit leaves no journal behind
+        self.journal.close(discard=True)
+        # Last, since exports and the journal read from it
+        self.canvas.store.close()
+        if tracer.enabled:
+            tracer.save()
+        super().closeEvent(event)
     
     def configure_shortcuts(self):
+        self.finish_startup()
         self.keybindings.configure_shortcuts()
 
     def export_to_html(self):
+        self.export('html')
+
+    def export_to_html_with_assets(self):
+        """Export HTML with screenshots saved as files in an assets folder"""
+        self.export('html_assets')
+
+    def export_to_docx(self):
+        self.export('docx')
+
+    def export(self, name):
+        """Export the canvas with the exporter registered as ``name``"""
+        spec = exporters.EXPORTERS[name]
         file_path, _ = QFileDialog.getSaveFileName(
-            self, "Save Document", "", "HTML files (*.html)"
+            self, "Save Document", "", spec.file_filter
         )
-        if file_path:
-            try:
-                self.canvas.save_as_html(file_path)
-                # Show success message
-                QMessageBox.information(self, "Export Successful", f"Document exported to {file_path}")
-            except Exception as e:
-                QMessageBox.critical(self, "Export Failed", f"Failed to export document: {str(e)}")
+        if not file_path:
+            return
+        try:
+            # The backend is imported here the first time it's used
+            exporter = spec.load()
+        except Exception as e:
+            QMessageBox.critical(self, "Export Failed", f"Failed to export document: {str(e)}")
+            return
+        # The export reads a snapshot on a worker thread, so the canvas can
+        # be edited while it runs
+        document = self.canvas.snapshot()
+        job = ExportJob(exporter, document, file_path, spec.label, self)
+        progress = ExportProgressDialog(f"Exporting {os.path.basename(file_path)}...", len(document), self)
+        job.progressed.connect(progress.report)
+        progress.canceled.connect(job.cancel)
+        job.finished.connect(lambda completed: self._export_done(job, progress, completed))
+        job.failed.connect(lambda message: self._export_done(job, progress, False, message))
+        self.export_jobs.append(job)
+        self.statusBar().showMessage(f"Exporting to {file_path}...", 2000)
+        job.start()
+
+    def _export_done(self, job, progress, completed, error=None):
+        self.export_jobs.remove(job)
+        self.release_images([])
+        progress.canceled.disconnect(job.cancel)
+        progress.close()
+        progress.deleteLater()
+        job.deleteLater()
+        if error is not None:
+            QMessageBox.critical(self, "Export Failed", f"Failed to export document: {error}")
+        elif completed:
+            self.statusBar().showMessage(f"Document exported to {job.file_path}", 5000)
+        else:
+            self.statusBar().showMessage("Export cancelled", 2000)
+
+    def release_images(self, keys):
+        """Take screenshots nothing refers to any more out of the image store
+
+        Exports read the snapshot they started from, so this waits until
+        none is running.
+        """
+        self._released_images.extend(keys)
+        if self.export_jobs:
+            return
+        for key in self._released_images:
+            self.canvas.store.discard(key)
+        self._released_images.clear()
+
+    def wait_for_exports(self):
+        """Block until background exports finish
+
+        Needed before the image store is cleared, since exports read from it.
+        """
+        if self.export_jobs:
+            self.statusBar().showMessage("Waiting for export to finish...")
+        for job in list(self.export_jobs):
+            job.wait()
     
     def copy_to_clipboard(self):
         try:
-            content = self.canvas.get_content_as_text()
-            pyperclip.copy(content)
-            # Optional: Show a small notification
+            with operation('Copy'):
+                self.canvas.copy_to_clipboard()
             self.statusBar().showMessage("Content copied to clipboard", 2000)
         except Exception as e:
             QMessageBox.warning(self, "Copy Failed", f"Failed to copy to clipboard: {str(e)}")
     
+    def paste_from_clipboard(self):
+        try:
+            with operation('Paste'), self.undo_stack.macro("Paste"):
+                count = self.canvas.paste_from_clipboard()
+            if count:
+                self.statusBar().showMessage(f"Pasted {count} item{'s' if count != 1 else ''}", 2000)
+            else:
+                self.statusBar().showMessage("Nothing to paste", 2000)
+        except Exception as e:
+            QMessageBox.warning(self, "Paste Failed", f"Failed to paste from clipboard: {str(e)}")
+    
     # Add these methods to MainWindow
     
     def save_project(self):
-        """Save the current project to a file"""
+        """Save the current project, asking for a file the first time
+
+        Returns True if the project was saved.
+        """
+        if self.project is None:
+            return self.save_project_as()
+        try:
+            with operation('Save Project'):
+                self.project.save(self.canvas.document_items())
+            self.statusBar().showMessage(f"Project saved to {self.project.path}", 2000)
+            return True
+        except Exception as e:
+            QMessageBox.critical(self, "Save Failed", f"Failed to save project: {str(e)}")
+            return False
+
+    def save_project_as(self):
+        """Save the current project to a new file"""
         file_path, _ = QFileDialog.getSaveFileName(
             self, "Save Project", "", "Documenta Project (*.docproj)"
         )
-        if file_path:
-            try:
-                # Implement project saving logic
-                # This would require serializing the canvas items
-                self.statusBar().showMessage(f"Project saved to {file_path}", 2000)
-            except Exception as e:
-                QMessageBox.critical(self, "Save Failed", f"Failed to save project: {str(e)}")
+        if not file_path:
+            return False
+        if self.project is not None and os.path.abspath(file_path) == os.path.abspath(self.project.path):
+            return self.save_project()
+        previous, self.project = self.project, ProjectFile(file_path)
+        if not self.save_project():
+            self.project = previous
+            return False
+        if previous is not None:
+            # Screenshots loaded from the previous file read from the new
+            # one from now on, so the previous file can be closed
+            self.wait_for_exports()
+            self.project.take_over(previous, self.canvas.store)
+            previous.close()
+        return True
     
     def load_project(self):
         """Load a project from a file"""
@@ -108,11 +372,25 @@ class MainWindow(QMainWindow):
         )
         if file_path:
             try:
-                # Implement project loading logic
+                with operation('Open Project'):
+                    project = ProjectFile.open(file_path)
+                    self.wait_for_exports()
+                    self.canvas.clear()
+                    self.close_project()
+                    self.project = project
+                    # Only the manifest has been read; screenshots are read
+                    # from the file as they scroll into view or get exported
+                    self.canvas.load_items(project.items(self.canvas.store))
+                    self.undo_stack.clear()
                 self.statusBar().showMessage(f"Project loaded from {file_path}", 2000)
             except Exception as e:
                 QMessageBox.critical(self, "Load Failed", f"Failed to load project: {str(e)}")
 
+    def close_project(self):
+        if self.project is not None:
+            self.project.close()
+            self.project = None
+
     def create_menu_bar(self):
         menu_bar = self.menuBar()
         
@@ -134,11 +412,31 @@ class MainWindow(QMainWindow):
         save_action.triggered.connect(self.save_project)
         file_menu.addAction(save_action)
         
+        save_as_action = QAction("Save As...", self)
+        save_as_action.triggered.connect(self.save_project_as)
+        file_menu.addAction(save_as_action)
+        
         file_menu.addSeparator()
         
-        export_html_action = QAction("Export to HTML", self)
-        export_html_action.triggered.connect(self.export_to_html)
-        file_menu.addAction(export_html_action)
+        # Exporters whose dependencies are missing are shown disabled
+        for spec in exporters.EXPORTERS.values():
+            export_action = QAction(f"Export to {spec.label}", self)
+            export_action.setEnabled(spec.available())
+            export_action.triggered.connect(lambda checked=False, name=spec.name: self.export(name))
+            file_menu.addAction(export_action)
+        
+        # Shared by HTML export, the clipboard and Word export
+        encoding_menu = file_menu.addMenu("Image Encoding")
+        encoding_group = QActionGroup(self)
+        for profile in PROFILES:
+            if not profile.available():
+                continue
+            action = QAction(profile.name, self)
+            action.setCheckable(True)
+            action.setChecked(profile is self.canvas.encoding_profile)
+            action.triggered.connect(lambda checked=False, profile=profile: self.set_encoding_profile(profile))
+            encoding_group.addAction(action)
+            encoding_menu.addAction(action)
         
         file_menu.addSeparator()
         
@@ -150,19 +448,88 @@ class MainWindow(QMainWindow):
         # Edit menu
         edit_menu = menu_bar.addMenu("Edit")
         
+        self.undo_action = QAction("Undo", self)
+        self.undo_action.setShortcut(QKeySequence.StandardKey.Undo)
+        self.undo_action.triggered.connect(self.undo_stack.undo)
+        edit_menu.addAction(self.undo_action)
+        
+        self.redo_action = QAction("Redo", self)
+        self.redo_action.setShortcut(QKeySequence.StandardKey.Redo)
+        self.redo_action.triggered.connect(self.undo_stack.redo)
+        edit_menu.addAction(self.redo_action)
+        
+        history_limit_action = QAction("History Limit...", self)
+        history_limit_action.triggered.connect(self.configure_history_limit)
+        edit_menu.addAction(history_limit_action)
+        
+        edit_menu.addSeparator()
+        
         copy_action = QAction("Copy to Clipboard", self)
         copy_action.setShortcut("Ctrl+C")
         copy_action.triggered.connect(self.copy_to_clipboard)
         edit_menu.addAction(copy_action)
         
+        # Text boxes keep Ctrl+V for themselves while they have focus
+        paste_action = QAction("Paste", self)
+        paste_action.setShortcut(QKeySequence.StandardKey.Paste)
+        paste_action.triggered.connect(self.paste_from_clipboard)
+        edit_menu.addAction(paste_action)
+        
+        # View menu
+        view_menu = menu_bar.addMenu("View")
+        
+        preview_action = self.preview_dock.toggleViewAction()
+        preview_action.setShortcut("Ctrl+Shift+P")
+        view_menu.addAction(preview_action)
+        
         # Tools menu
         tools_menu = menu_bar.addMenu("Tools")
         
         screenshot_action = QAction("Take Screenshot", self)
         screenshot_action.setShortcut("Ctrl+Shift+S")
-        screenshot_action.triggered.connect(self.screenshot_tool.start_capture)
+        screenshot_action.triggered.connect(lambda: self.capture_tool().start_capture())
         tools_menu.addAction(screenshot_action)
         
+        region_action = QAction("Capture Region", self)
+        region_action.setShortcut("Ctrl+Shift+R")
+        region_action.triggered.connect(lambda: self.capture_tool().start_region_capture())
+        tools_menu.addAction(region_action)
+        
+        # Filled when opened, since monitors can come and go
+        self.monitor_menu = tools_menu.addMenu("Capture Monitor")
+        self.monitor_menu.aboutToShow.connect(self.populate_monitor_menu)
+        
+        self.burst_action = QAction("Burst Capture", self)
+        self.burst_action.setCheckable(True)
+        self.burst_action.setShortcut("Ctrl+Shift+B")
+        self.burst_action.toggled.connect(self.toggle_burst_capture)
+        tools_menu.addAction(self.burst_action)
+        
+        burst_interval_action = QAction("Burst Interval...", self)
+        burst_interval_action.triggered.connect(self.configure_burst_interval)
+        tools_menu.addAction(burst_interval_action)
+        
+        # Duplicate detection needs NumPy
+        drop_duplicates_action = QAction("Drop Duplicate Captures", self)
+        drop_duplicates_action.setCheckable(True)
+        drop_duplicates_action.setEnabled(image_diff.available())
+        drop_duplicates_action.toggled.connect(
+            lambda checked: setattr(self.capture_tool().pipeline, 'drop_duplicates', checked))
+        tools_menu.addAction(drop_duplicates_action)
+        
+        crop_changes_action = QAction("Crop Captures to Changed Region", self)
+        crop_changes_action.setCheckable(True)
+        crop_changes_action.setEnabled(image_diff.available())
+        crop_changes_action.toggled.connect(
+            lambda checked: setattr(self.capture_tool().pipeline, 'crop_to_changes', checked))
+        tools_menu.addAction(crop_changes_action)
+        
+        trace_action = QAction("Record Trace", self)
+        trace_action.setCheckable(True)
+        trace_action.setChecked(tracer.enabled)
+        trace_action.toggled.connect(self.toggle_tracing)
+        tools_menu.addAction(trace_action)
+        
         add_text_action = QAction("Add Text Box", self)
         add_text_action.setShortcut("Ctrl+T")
         add_text_action.triggered.connect(self.canvas.add_text)
@@ -173,17 +540,83 @@ class MainWindow(QMainWindow):
         add_code_action.triggered.connect(self.canvas.add_code)
         tools_menu.addAction(add_code_action)
 
+    def update_history(self):
+        self.history_label.setText(self.undo_stack.summary())
+        label = self.undo_stack.undo_label()
+        self.undo_action.setText(f"Undo {label}" if label else "Undo")
+        self.undo_action.setEnabled(self.undo_stack.can_undo())
+        label = self.undo_stack.redo_label()
+        self.redo_action.setText(f"Redo {label}" if label else "Redo")
+        self.redo_action.setEnabled(self.undo_stack.can_redo())
+
+    def configure_history_limit(self):
+        limit, ok = QInputDialog.getInt(
+            self, "History Limit", "Keep undo history up to (MB):",
+            self.undo_stack.max_bytes // (1024 * 1024), 1, 4096)
+        if ok:
+            self.undo_stack.set_max_bytes(limit * 1024 * 1024)
+
+    def set_encoding_profile(self, profile):
+        self.canvas.encoding_profile = profile
+        self.statusBar().showMessage(f"Images will be exported as {profile.name}", 2000)
+
+    def toggle_tracing(self, enabled):
+        self.trace_label.setVisible(enabled)
+        if enabled:
+            tracer.clear()
+            tracer.enable()
+            self.statusBar().showMessage("Tracing started", 2000)
+            return
+        tracer.disable()
+        try:
+            path = tracer.save()
+            self.statusBar().showMessage(f"Trace written to {path}", 5000)
+        except OSError as e:
+            QMessageBox.warning(self, "Trace Failed", f"Failed to write trace: {str(e)}")
+
+    def populate_monitor_menu(self):
+        self.monitor_menu.clear()
+        for index, screen in enumerate(QApplication.screens(), 1):
+            geometry = screen.geometry()
+            action = self.monitor_menu.addAction(
+                f"{index}: {screen.name()} ({geometry.width()}x{geometry.height()})")
+            action.triggered.connect(lambda checked=False, screen=screen: self.capture_tool().capture_screen(screen))
+
+    def toggle_burst_capture(self, enabled):
+        if enabled:
+            self.capture_tool().start_burst()
+        else:
+            self.capture_tool().stop_burst()
+
+    def configure_burst_interval(self):
+        tool = self.capture_tool()
+        interval, ok = QInputDialog.getInt(
+            self, "Burst Interval", "Capture every (ms):",
+            tool.burst_interval_ms, 50, 60000, 50)
+        if ok:
+            tool.burst_interval_ms = interval
+            if tool.burst_active():
+                tool.start_burst()
+
     def new_project(self):
         """Create a new empty project"""
         # Ask for confirmation if there's content
         if self.canvas.items:
             reply = QMessageBox.question(self, "New Project", 
-                                        "Are you sure you want to create a new project? Any unsaved changes will be lost.",
+                                        "Are you sure you want to create a new project? Edit > Undo brings the current document back.",
                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
             if reply == QMessageBox.StandardButton.No:
                 return
                 
-        # Clear the canvas
-        self.canvas.items.clear()
-        self.canvas.update_layout()
+        # Items are removed one by one rather than cleared, as one undo
+        # step; the image store keeps their screenshots for Undo
+        with self.undo_stack.macro("New Project"):
+            for index in reversed(range(len(self.canvas.items))):
+                self.canvas.remove_item(index)
+        # Screenshots brought back by Undo may have been loaded from the
+        # project file; copy them into the spill so it can be closed
+        if self.project is not None:
+            self.wait_for_exports()
+            self.canvas.store.rehome(self.project)
+            self.close_project()
         self.statusBar().showMessage("New project created", 2000)
\ No newline at end of file
@@ -0,0 +1,62 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+# How long to wait on a worker before giving the progress hook another
+# chance to run, so the GUI can repaint and react to Cancel.
+POLL_INTERVAL = 0.05
+
+
+def default_workers():
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def process_in_order(items, prepare, consume, progress=None, max_workers=None):
+    """Prepare items on a thread pool and consume the results in order
+
+    ``prepare(item)`` is called on the calling thread, in order, and returns
+    either a finished result or a zero-argument callable that produces one.
+    Callables run on a thread pool; at most ``max_workers`` of them are in
+    flight, so only that many results (typically encoded images) are held
+    at once. ``consume(result)`` is called on the calling thread, in item
+    order, as soon as each result is ready.
+
+    ``progress(done, total)`` is called after every item and periodically
+    while waiting on a worker. If it returns False, outstanding work is
+    cancelled and False is returned; otherwise True.
+    """
+    max_workers = max_workers or default_workers()
+    total = len(items)
+    pending = []
+    done = 0
+
+    def report():
+        return progress is None or progress(done, total) is not False
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        index = 0
+        while index < total or pending:
+            # Keep the pool busy without queueing the whole document
+            while index < total and len(pending) < max_workers:
+                result = prepare(items[index])
+                if callable(result):
+                    result = executor.submit(result)
+                else:
+                    result = (result,)
+                pending.append(result)
+                index += 1
+
+            result = pending.pop(0)
+            while not isinstance(result, tuple):
+                try:
+                    result = (result.result(timeout=POLL_INTERVAL),)
+                except TimeoutError:
+                    if not report():
+                        return False
+            consume(result[0])
+            done += 1
+            if not report():
+                return False
+        return True
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,266 @@
+import json
+import os
+import struct
+import threading
+
+from html_export import data_digest
+from tracing import span
+
+MAGIC = b'DOCPROJ1'
+TRAILER_MAGIC = b'DPTRAILR'
+# manifest offset, manifest length, magic
+TRAILER = struct.Struct('<QQ8s')
+VERSION = 1
+# Rewrite the file once stale manifests and orphaned images take up more
+# space than this fraction of it
+COMPACT_RATIO = 0.5
+COMPACT_MIN_BYTES = 1024 * 1024
+SCAN_CHUNK = 1024 * 1024
+
+
+class ProjectFormatError(Exception):
+    pass
+
+
+class ProjectFile:
+    """A .docproj container: image blobs plus a small JSON manifest
+
+    The file is append-only. Images are stored once each as compressed
+    blobs addressed by content digest; every save appends the blobs that
+    are not in the file yet, then a fresh manifest (item order, types,
+    text) and a fixed-size trailer pointing at it. Readers use the last
+    trailer, so saving an edited project only costs the new images and the
+    manifest. When stale data outweighs live data the file is compacted
+    by copying live blobs into a new file, without re-encoding.
+
+    A ProjectFile is also the image source for screenshots loaded from it;
+    blobs are only read when the image store needs them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._blobs = {}
+        self._digests = {}
+        # Handles that read their blob from this file, and their store;
+        # compaction keeps those blobs while the store still holds them
+        self._external = {}
+        self._store = None
+        self._manifest = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path):
+        """Open an existing project, reading only its manifest"""
+        project = cls(path)
+        project._file = open(path, 'r+b')
+        try:
+            project._manifest = project._read_manifest()
+        except Exception:
+            project.close()
+            raise
+        project._blobs = {digest: tuple(ref) for digest, ref in project._manifest['blobs'].items()}
+        return project
+
+    def items(self, store):
+        """Return the items of the opened project
+
+        Items are ``(type, content)`` tuples: text and code carry their
+        string, images an ImageHandle from ``store`` that reads its blob
+        lazily from this file.
+        """
+        items = []
+        self._store = store
+        for entry in self._manifest['items']:
+            if entry['type'] == 'image':
+                digest = entry['blob']
+                handle = store.add_external(self, digest, entry['width'], entry['height'])
+                self._digests[handle.key] = digest
+                self._external[handle.key] = digest
+                items.append(('image', handle))
+            else:
+                items.append((entry['type'], entry['text']))
+        return items
+
+    def has(self, digest):
+        with self._lock:
+            return digest in self._blobs
+
+    def take_over(self, previous, store):
+        """Make screenshots read from ``previous`` read from this file
+
+        Call after saving here. Images this file lacks, such as deleted
+        ones kept for undo, are copied into the store's spill; ``previous``
+        can be closed afterwards.
+        """
+        moved = store.rehome(previous, self)
+        self._store = store
+        self._external.update(moved)
+        self._digests.update(moved)
+
+    def read(self, digest):
+        """Return the bytes of one image blob (any thread)"""
+        with self._lock:
+            if self._file is None:
+                raise ValueError(f"{self.path} is closed")
+            offset, length = self._blobs[digest]
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def save(self, items):
+        """Append what changed since the last save and a new manifest
+
+        ``items`` has the same shape as returned by items(). Images already
+        in the file are recognised by handle without touching their pixels.
+        """
+        entries = []
+        new_blobs = []
+        for type_, content in items:
+            if type_ == 'image':
+                digest = self._digests.get(content.key)
+                if digest is None or digest not in self._blobs:
+                    # New, or dropped by a compaction since it was saved,
+                    # e.g. deleted and brought back by undo
+                    data = content.encoded()
+                    if digest is None:
+                        digest = data_digest(data)
+                        self._digests[content.key] = digest
+                    if digest not in self._blobs:
+                        new_blobs.append((digest, data))
+                entries.append({'type': 'image', 'blob': digest,
+                                'width': content.width(), 'height': content.height()})
+            else:
+                entries.append({'type': type_, 'text': content})
+
+        with self._lock, span('project.write', blobs=len(new_blobs)):
+            if self._file is None:
+                self._create(entries, new_blobs)
+                return
+            self._file.seek(0, os.SEEK_END)
+            for digest, data in new_blobs:
+                if digest in self._blobs:
+                    continue
+                self._blobs[digest] = (self._file.tell(), len(data))
+                self._file.write(data)
+            self._write_manifest(self._file, entries)
+            self._file.flush()
+            with span('project.fsync'):
+                os.fsync(self._file.fileno())
+            stale = self._file.tell() - self._live_size(entries)
+            if stale > COMPACT_MIN_BYTES and stale > self._file.tell() * COMPACT_RATIO:
+                self._compact(entries)
+
+    def _create(self, entries, new_blobs):
+        # Called with the lock held. The first save is written beside the
+        # target and swapped in, so a file being overwritten, which may
+        # still back screenshots of another project, is never truncated
+        # in place.
+        tmp_path = self.path + '.tmp'
+        blobs = {}
+        try:
+            with open(tmp_path, 'w+b') as out:
+                out.write(MAGIC)
+                for digest, data in new_blobs:
+                    if digest not in blobs:
+                        blobs[digest] = (out.tell(), len(data))
+                        out.write(data)
+                self._blobs = blobs
+                self._write_manifest(out, entries)
+                out.flush()
+                with span('project.fsync'):
+                    os.fsync(out.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            self._blobs = {}
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._file = open(self.path, 'r+b')
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _live_blobs(self, entries):
+        # Blobs in the manifest, plus those still read lazily by handles
+        # that are off the canvas but may return through undo
+        used = {entry['blob'] for entry in entries if entry['type'] == 'image'}
+        if self._store is not None:
+            used.update(digest for key, digest in self._external.items()
+                        if digest in self._blobs and self._store.contains(key))
+        return used
+
+    def _live_size(self, entries):
+        return sum(self._blobs[digest][1] for digest in self._live_blobs(entries))
+
+    def _write_manifest(self, f, entries):
+        # Only blobs the manifest refers to are indexed; anything else
+        # becomes garbage for the next compaction
+        used = {entry['blob'] for entry in entries if entry['type'] == 'image'}
+        manifest = {
+            'version': VERSION,
+            'items': entries,
+            'blobs': {digest: ref for digest, ref in self._blobs.items() if digest in used},
+        }
+        data = json.dumps(manifest, separators=(',', ':')).encode('utf-8')
+        offset = f.tell()
+        f.write(data)
+        f.write(TRAILER.pack(offset, len(data), TRAILER_MAGIC))
+
+    def _read_manifest(self):
+        self._file.seek(0)
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ProjectFormatError(f"{self.path} is not a Documenta project")
+        self._file.seek(0, os.SEEK_END)
+        size = self._file.tell()
+        if size < len(MAGIC) + TRAILER.size:
+            raise ProjectFormatError(f"{self.path} is truncated")
+        offset, length = self._find_trailer(size)
+        self._file.seek(offset)
+        manifest = json.loads(self._file.read(length).decode('utf-8'))
+        if manifest.get('version') != VERSION:
+            raise ProjectFormatError(f"Unsupported project version {manifest.get('version')}")
+        return manifest
+
+    def _find_trailer(self, size):
+        # Normally the trailer is the last thing in the file. If a save was
+        # interrupted, fall back to the newest complete one before it.
+        end = size
+        while end >= len(MAGIC) + TRAILER.size:
+            self._file.seek(end - TRAILER.size)
+            offset, length, magic = TRAILER.unpack(self._file.read(TRAILER.size))
+            if magic == TRAILER_MAGIC and offset + length == end - TRAILER.size:
+                return offset, length
+            start = max(len(MAGIC), end - TRAILER.size - SCAN_CHUNK)
+            self._file.seek(start)
+            chunk = self._file.read(end - 1 - start)
+            found = chunk.rfind(TRAILER_MAGIC)
+            if found == -1:
+                # Keep an overlap so a magic split across chunks is not missed
+                end = start + len(TRAILER_MAGIC) - 1 if start > len(MAGIC) else 0
+            else:
+                end = start + found + len(TRAILER_MAGIC)
+        raise ProjectFormatError(f"{self.path} has no valid manifest")
+
+    def _compact(self, entries):
+        # Called with the lock held. Blobs are copied, not re-encoded, and
+        # the new file replaces the old one atomically.
+        used = self._live_blobs(entries)
+        tmp_path = self.path + '.tmp'
+        blobs = {}
+        with open(tmp_path, 'w+b') as out:
+            out.write(MAGIC)
+            for digest in used:
+                offset, length = self._blobs[digest]
+                self._file.seek(offset)
+                blobs[digest] = (out.tell(), length)
+                out.write(self._file.read(length))
+            self._blobs = blobs
+            self._write_manifest(out, entries)
+            out.flush()
+            os.fsync(out.fileno())
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'r+b')
@@ -1,9 +1,20 @@
 from PyQt6.QtWidgets import QWidget, QRubberBand, QLabel
-from PyQt6.QtCore import Qt, QRect, QPoint, QTimer
-from PyQt6.QtGui import QScreen, QGuiApplication, QColor
+from PyQt6.QtCore import Qt, QRect, QPoint, QTimer, pyqtSignal
+from PyQt6.QtGui import QScreen, QGuiApplication, QColor, QPainter
+from capture_pipeline import CapturePipeline
+from tracing import tracer
 import sys
+import time
+
+DEFAULT_BURST_INTERVAL_MS = 1000
+# Smaller selections are treated as an accidental click
+MIN_REGION_SIZE = 4
+OVERLAY_HIDE_DELAY_MS = 100
 
 class ScreenshotTool(QWidget):
+    # Short feedback for the status bar
+    status_message = pyqtSignal(str)
+
     def __init__(self, canvas):
         super().__init__()
         self.canvas = canvas
@@ -14,19 +25,126 @@ class ScreenshotTool(QWidget):
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
         self.setStyleSheet("background-color: transparent;")
         
+        # Compression and storage happen on the pipeline's worker thread
+        self.pipeline = CapturePipeline(canvas.store, parent=self)
+        self.pipeline.captured.connect(self._on_captured)
+        self.pipeline.discarded.connect(
+            lambda timing: self.status_message.emit(f"Dropped {timing.summary()}"))
+        self.pipeline.failed.connect(
+            lambda error: self.status_message.emit(f"Capture failed: {error}"))
+        
+        # Burst mode: capture every burst_interval_ms, and immediately on
+        # each hotkey press, until stopped
+        self.burst_interval_ms = DEFAULT_BURST_INTERVAL_MS
+        self.burst_timer = QTimer(self)
+        self.burst_timer.timeout.connect(self._perform_capture)
+        
     def start_capture(self):
+        if self.burst_active():
+            self._perform_capture()
+            return
         # Add a small delay to allow the user to prepare
         QTimer.singleShot(500, self._perform_capture)
         
+    def burst_active(self):
+        return self.burst_timer.isActive()
+        
+    def start_burst(self):
+        self.burst_timer.start(max(1, self.burst_interval_ms))
+        self.status_message.emit(f"Burst capture every {self.burst_interval_ms} ms")
+        
+    def stop_burst(self):
+        self.burst_timer.stop()
+        pending = self.pipeline.pending()
+        still = f", {pending} still compressing" if pending else ""
+        self.status_message.emit(
+            f"Burst capture stopped ({self.pipeline.completed} captured, {self.pipeline.dropped} skipped{still})")
+
+    def shutdown(self):
+        """Stop capturing and wait for queued captures to be stored"""
+        self.burst_timer.stop()
+        self.pipeline.close()
+        
+    def start_region_capture(self):
+        """Let the user drag out a rectangle and capture only that"""
+        # Cover the whole virtual desktop with a translucent overlay; the
+        # desktop itself is not grabbed until the region is known
+        self.setGeometry(QGuiApplication.primaryScreen().virtualGeometry())
+        self.setCursor(Qt.CursorShape.CrossCursor)
+        if self.rubberband is None:
+            self.rubberband = QRubberBand(QRubberBand.Shape.Rectangle, self)
+        self.rubberband.hide()
+        self.show()
+        self.activateWindow()
+        self.grabKeyboard()
+        
+    def capture_screen(self, screen):
+        """Capture one monitor"""
+        self._capture(screen, screen.geometry())
+        
+    def paintEvent(self, event):
+        # Dim the desktop while selecting so the overlay is visible
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(0, 0, 0, 60))
+        
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.origin = event.pos()
+            self.rubberband.setGeometry(QRect(self.origin, self.origin))
+            self.rubberband.show()
+            
+    def mouseMoveEvent(self, event):
+        if self.rubberband is not None and self.rubberband.isVisible():
+            self.rubberband.setGeometry(QRect(self.origin, event.pos()).normalized())
+            
+    def mouseReleaseEvent(self, event):
+        if event.button() != Qt.MouseButton.LeftButton or not self.rubberband.isVisible():
+            return
+        local = QRect(self.origin, event.pos()).normalized()
+        region = QRect(self.mapToGlobal(local.topLeft()), local.size())
+        self._end_region_capture()
+        if region.width() < MIN_REGION_SIZE or region.height() < MIN_REGION_SIZE:
+            self.status_message.emit("Region capture cancelled")
+            return
+        # Give the compositor a moment to remove the overlay before grabbing
+        QTimer.singleShot(OVERLAY_HIDE_DELAY_MS, lambda: self._capture_region(region))
+        
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key.Key_Escape:
+            self._end_region_capture()
+            self.status_message.emit("Region capture cancelled")
+            
+    def _end_region_capture(self):
+        self.releaseKeyboard()
+        self.rubberband.hide()
+        self.hide()
+        
+    def _capture_region(self, region):
+        # A region is captured from the monitor under its centre and clipped
+        # to that monitor
+        screen = QGuiApplication.screenAt(region.center()) or QGuiApplication.primaryScreen()
+        self._capture(screen, region.intersected(screen.geometry()))
+        
     def _perform_capture(self):
         # Take a full screenshot of the entire screen
         screen = QGuiApplication.primaryScreen()
+        self._capture(screen, screen.geometry())
         
-        # Capture the entire screen (0 is the ID for the entire desktop)
-        screenshot = screen.grabWindow(0)
-        
-        # Add the screenshot to the canvas
-        self.canvas.add_screenshot(screenshot)
+    def _capture(self, screen, rect):
+        # Grab only ``rect`` (global coordinates) from ``screen``; window 0
+        # is the whole screen and the offset is relative to its origin
+        origin = screen.geometry().topLeft()
+        start = time.perf_counter()
+        screenshot = screen.grabWindow(0, rect.x() - origin.x(), rect.y() - origin.y(),
+                                       rect.width(), rect.height())
+        grab_ms = (time.perf_counter() - start) * 1000
+        tracer.record('capture.grab', start, grab_ms / 1000)
         
-        # Debug info
-        print(f"Captured full screen screenshot: {screenshot.width()}x{screenshot.height()}")
\ No newline at end of file
+        # Hand the rest to the pipeline; when it is full, skip this frame
+        # rather than buffer it
+        if not self.pipeline.submit(screenshot, grab_ms):
+            self.status_message.emit("Capture skipped: still saving previous screenshots")
+            
+    def _on_captured(self, handle, timing):
+        self.canvas.add_image(handle)
+        self.status_message.emit(f"Captured {timing.summary()}")
@@ -0,0 +1,189 @@
+"""Lightweight span tracing for captures, canvas operations and exports
+
+Tracing is off unless DOCUMENTA_TRACE is set (to a file name, or to 1 for
+DEFAULT_TRACE_PATH) or it is switched on from the Tools menu. While off,
+span() returns a shared no-op context manager, so instrumented code pays
+for one attribute check.
+
+Spans are written as Chrome trace events (load the file in
+chrome://tracing or https://ui.perfetto.dev). An operation is a span
+around a user action, such as an export; when it ends, the time
+spent in the spans that finished during it, on any thread, is totalled by
+name and passed to the tracer's listeners.
+"""
+import json
+import os
+import threading
+import time
+
+TRACE_ENV = 'DOCUMENTA_TRACE'
+DEFAULT_TRACE_PATH = os.path.join(os.path.expanduser('~'), '.documenta', 'trace.json')
+# Older events are dropped past this, so a forgotten trace can't eat memory
+MAX_EVENTS = 1000000
+# Span names listed in an operation's summary
+SUMMARY_SPANS = 4
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter() - self.start, self.args)
+        return False
+
+
+class Operation(Span):
+    __slots__ = ('mark',)
+
+    def __enter__(self):
+        self.mark = self.tracer.event_count()
+        return super().__enter__()
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        event = self.tracer.record(self.name, self.start, duration, self.args)
+        self.tracer.finish_operation(self, duration, event)
+        return False
+
+
+class OperationSummary:
+    """Wall time of one operation and the time spent per span name"""
+
+    __slots__ = ('name', 'ms', 'breakdown')
+
+    def __init__(self, name, ms, breakdown):
+        self.name = name
+        self.ms = ms
+        # [(span name, total ms, count)], longest first
+        self.breakdown = breakdown
+
+    def text(self):
+        parts = ', '.join(f"{name} {ms:.0f} ms" + (f" ({count}x)" if count > 1 else '')
+                          for name, ms, count in self.breakdown[:SUMMARY_SPANS])
+        return f"{self.name} took {self.ms:.0f} ms" + (f": {parts}" if parts else '')
+
+
+class Tracer:
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_TRACE_PATH
+        self.enabled = False
+        self.last_operation = None
+        # Called with an OperationSummary when an operation ends, on the
+        # thread that ran it
+        self.listeners = []
+        self._events = []
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._epoch = time.perf_counter()
+        self._pid = os.getpid()
+
+    def enable(self, path=None):
+        if path:
+            self.path = path
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, **args):
+        """Context manager timing a block as a span called ``name``"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def operation(self, name, **args):
+        """Like span(), and summarize the spans finished within it"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Operation(self, name, args)
+
+    def record(self, name, start, duration, args=None):
+        """Add a finished span; ``start`` and ``duration`` in perf_counter seconds"""
+        if not self.enabled:
+            return None
+        thread = threading.current_thread()
+        event = {'name': name, 'ph': 'X', 'pid': self._pid, 'tid': thread.ident,
+                 'ts': round((start - self._epoch) * 1e6, 1), 'dur': round(duration * 1e6, 1)}
+        if args:
+            event['args'] = args
+        with self._lock:
+            if len(self._events) >= MAX_EVENTS:
+                del self._events[:MAX_EVENTS // 10]
+            self._events.append(event)
+            self._threads[thread.ident] = thread.name
+        return event
+
+    def event_count(self):
+        with self._lock:
+            return len(self._events)
+
+    def finish_operation(self, operation, duration, own_event):
+        with self._lock:
+            events = self._events[operation.mark:]
+        totals = {}
+        for event in events:
+            if event is own_event:
+                continue
+            ms, count = totals.get(event['name'], (0.0, 0))
+            totals[event['name']] = (ms + event['dur'] / 1000, count + 1)
+        breakdown = sorted(((name, ms, count) for name, (ms, count) in totals.items()),
+                           key=lambda entry: entry[1], reverse=True)
+        self.last_operation = OperationSummary(operation.name, duration * 1000, breakdown)
+        for listener in self.listeners:
+            listener(self.last_operation)
+
+    def save(self, path=None):
+        """Write the trace as Chrome trace JSON and return the path"""
+        path = path or self.path
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid, 'args': {'name': name}}
+                    for tid, name in threads.items()]
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path + '.part', 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+        os.replace(path + '.part', path)
+        return path
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+        self.last_operation = None
+
+
+tracer = Tracer()
+if os.environ.get(TRACE_ENV):
+    tracer.enable(None if os.environ[TRACE_ENV] == '1' else os.environ[TRACE_ENV])
+
+
+def span(name, **args):
+    return tracer.span(name, **args)
+
+
+def operation(name, **args):
+    return tracer.operation(name, **args)
@@ -0,0 +1,342 @@
+import sys
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+DEFAULT_HISTORY_BYTES = 64 * 1024 * 1024
+# A pause in typing this long ends one text edit step
+TEXT_MERGE_MS = 1000
+# Bookkeeping per step, so a history of image steps is bounded too
+COMMAND_BYTES = 200
+
+
+def text_bytes(text):
+    return sys.getsizeof(text)
+
+
+class InsertItem:
+    """An item was added at ``index``; content is its text or image handle
+
+    Screenshots are held by handle, so undoing a delete shares the pixels
+    still in the canvas's image store instead of copying them.
+    """
+
+    __slots__ = ('index', 'type', 'content')
+    label = "Add"
+
+    def __init__(self, index, type_, content):
+        self.index = index
+        self.type = type_
+        self.content = content
+
+    def size(self):
+        return COMMAND_BYTES + (0 if self.type == 'image' else text_bytes(self.content))
+
+    def undo(self, canvas):
+        canvas.remove_item(self.index)
+
+    def redo(self, canvas):
+        canvas.insert_item(self.index, self.type, self.content)
+
+
+class RemoveItem(InsertItem):
+    __slots__ = ()
+    label = "Delete"
+
+    def undo(self, canvas):
+        InsertItem.redo(self, canvas)
+
+    def redo(self, canvas):
+        InsertItem.undo(self, canvas)
+
+
+class MoveItem:
+    __slots__ = ('source', 'index')
+    label = "Move"
+
+    def __init__(self, source, index):
+        self.source = source
+        self.index = index
+
+    def size(self):
+        return COMMAND_BYTES
+
+    def undo(self, canvas):
+        canvas.move_item(self.index, self.source)
+
+    def redo(self, canvas):
+        canvas.move_item(self.source, self.index)
+
+
+class EditText:
+    """A run of typing in one item; ``new`` is None while it's still going"""
+
+    __slots__ = ('index', 'old', 'new')
+    label = "Typing"
+
+    def __init__(self, index, old):
+        self.index = index
+        self.old = old
+        self.new = None
+
+    def size(self):
+        return COMMAND_BYTES + text_bytes(self.old) + (0 if self.new is None else text_bytes(self.new))
+
+    def undo(self, canvas):
+        canvas.set_item_text(self.index, self.old)
+
+    def redo(self, canvas):
+        canvas.set_item_text(self.index, self.new)
+
+
+class Macro:
+    """Several commands undone and redone as one step"""
+
+    __slots__ = ('label', 'commands')
+
+    def __init__(self, label):
+        self.label = label
+        self.commands = []
+
+    def size(self):
+        return sum(command.size() for command in self.commands)
+
+    def undo(self, canvas):
+        for command in reversed(self.commands):
+            command.undo(canvas)
+
+    def redo(self, canvas):
+        for command in self.commands:
+            command.redo(canvas)
+
+
+def image_keys(command):
+    """Yield the keys of the screenshots ``command`` holds"""
+    if isinstance(command, Macro):
+        for child in command.commands:
+            yield from image_keys(child)
+    elif isinstance(command, InsertItem) and command.type == 'image':
+        yield command.content.cacheKey()
+
+
+class UndoStack(QObject):
+    """Undo/redo history of a CanvasPanel, recorded from its signals
+
+    Like the journal, it follows the canvas through item_added,
+    item_removed, item_moved and item_edited, so every change is recorded
+    however it was made. Commands refer to items by position. Consecutive
+    typing in one item is merged into a single step until a pause of
+    TEXT_MERGE_MS or any other change. The oldest steps are dropped once
+    the history holds more than ``max_bytes``. Clearing the canvas empties
+    the history, since it also empties the image store.
+
+    When dropped steps held the last reference to a screenshot that isn't
+    on the canvas either, its key is emitted through ``released`` so the
+    image store can let it go.
+    """
+    changed = pyqtSignal()
+    released = pyqtSignal(object)   # keys of screenshots nothing refers to
+
+    def __init__(self, canvas, max_bytes=DEFAULT_HISTORY_BYTES, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._undo = deque()
+        self._redo = []
+        self._macro = None
+        # Set while a command is applied, so the canvas signals it causes
+        # aren't recorded again
+        self._applying = False
+        # container -> text as of the last recorded step
+        self._texts = {}
+        # (container, EditText) of the typing run in progress
+        self._editing = None
+        # Screenshot key -> number of steps in either history holding it
+        self._image_refs = Counter()
+        self._text_timer = QTimer(self)
+        self._text_timer.setSingleShot(True)
+        self._text_timer.setInterval(TEXT_MERGE_MS)
+        self._text_timer.timeout.connect(self.flush_text)
+        for type_, container, content in canvas.items:
+            if type_ != 'image':
+                self._texts[container] = content.toPlainText()
+        canvas.item_added.connect(self._on_added)
+        canvas.item_removed.connect(self._on_removed)
+        canvas.item_moved.connect(self._on_moved)
+        canvas.item_edited.connect(self._on_edited)
+        canvas.cleared.connect(self.clear)
+
+    def can_undo(self):
+        return bool(self._undo) or self._editing is not None
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def undo_label(self):
+        if self._editing is not None:
+            return EditText.label
+        return self._undo[-1].label if self._undo else None
+
+    def redo_label(self):
+        return self._redo[-1].label if self._redo else None
+
+    def undo(self):
+        self.flush_text()
+        if not self._undo:
+            return
+        command = self._undo.pop()
+        self._apply(command.undo)
+        self._redo.append(command)
+        self.changed.emit()
+
+    def redo(self):
+        self.flush_text()
+        if not self._redo:
+            return
+        command = self._redo.pop()
+        self._apply(command.redo)
+        self._undo.append(command)
+        self.changed.emit()
+
+    def clear(self):
+        self._text_timer.stop()
+        self._editing = None
+        self._undo.clear()
+        self._redo.clear()
+        self._image_refs.clear()
+        self.size_bytes = 0
+        self._texts = {container: content.toPlainText()
+                       for type_, container, content in self.canvas.items if type_ != 'image'}
+        self.changed.emit()
+
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._trim()
+        self.changed.emit()
+
+    def summary(self):
+        steps = len(self._undo) + len(self._redo)
+        return f"History: {steps} step{'s' if steps != 1 else ''}, {self.size_bytes / 1024:.0f} KB"
+
+    @contextmanager
+    def macro(self, label):
+        """Record the changes made inside the block as one step"""
+        self.flush_text()
+        self._macro = Macro(label)
+        try:
+            yield
+        finally:
+            self.flush_text()
+            macro, self._macro = self._macro, None
+            if macro.commands:
+                self._push(macro)
+
+    def flush_text(self):
+        """End the typing run in progress, recording its final text"""
+        self._text_timer.stop()
+        if self._editing is None:
+            return
+        (container, command), self._editing = self._editing, None
+        index = self.canvas.index_of(container)
+        if index != -1:
+            self._texts[container] = self.canvas.items[index][2].toPlainText()
+        text = self._texts[container]
+        if text == command.old:
+            # Typed and deleted again; nothing to undo
+            self._discard(command)
+        else:
+            command.new = text
+            if self._macro is None:
+                self.size_bytes += text_bytes(text)
+                self._trim()
+        self.changed.emit()
+
+    def _apply(self, action):
+        self._applying = True
+        try:
+            action(self.canvas)
+        finally:
+            self._applying = False
+
+    def _push(self, command):
+        if self._macro is not None:
+            self._macro.commands.append(command)
+            return
+        # Counted first, since it may hold screenshots the redo steps did
+        self._image_refs.update(image_keys(command))
+        dropped = []
+        for undone in self._redo:
+            self.size_bytes -= undone.size()
+            dropped.extend(self._release(undone))
+        self._redo.clear()
+        self._undo.append(command)
+        self.size_bytes += command.size()
+        self._trim(dropped)
+        self.changed.emit()
+
+    def _discard(self, command):
+        if self._macro is not None:
+            self._macro.commands.remove(command)
+            return
+        self._undo.remove(command)
+        self.size_bytes -= command.size()
+
+    def _trim(self, dropped=None):
+        dropped = [] if dropped is None else dropped
+        while self.size_bytes > self.max_bytes and len(self._undo) > 1:
+            command = self._undo.popleft()
+            self.size_bytes -= command.size()
+            dropped.extend(self._release(command))
+        if dropped:
+            # Those back on the canvas through undo or redo are still used
+            shown = {content.cacheKey() for type_, container, content in self.canvas.items if type_ == 'image'}
+            keys = [key for key in dict.fromkeys(dropped) if key not in shown]
+            if keys:
+                self.released.emit(keys)
+
+    def _release(self, command):
+        # Keys of the screenshots only ``command`` was still holding
+        for key in image_keys(command):
+            self._image_refs[key] -= 1
+            if self._image_refs[key] <= 0:
+                del self._image_refs[key]
+                yield key
+
+    def _on_added(self, index):
+        type_, container, content = self.canvas.items[index]
+        text = None if type_ == 'image' else content.toPlainText()
+        if text is not None:
+            self._texts[container] = text
+        if not self._applying:
+            self.flush_text()
+            self._push(InsertItem(index, type_, content if text is None else text))
+
+    def _on_removed(self, index, item):
+        type_, container, content = item
+        if not self._applying:
+            if self._editing is not None and self._editing[0] is container:
+                # The run ends with the text the item had when removed
+                self._texts[container] = content.toPlainText()
+            self.flush_text()
+            self._push(RemoveItem(index, type_, content if type_ == 'image' else self._texts[container]))
+        self._texts.pop(container, None)
+
+    def _on_moved(self, source, index):
+        if not self._applying:
+            self.flush_text()
+            self._push(MoveItem(source, index))
+
+    def _on_edited(self, container):
+        if self._applying:
+            self._texts[container] = self.canvas.items[self.canvas.index_of(container)][2].toPlainText()
+            return
+        if self._editing is None or self._editing[0] is not container:
+            self.flush_text()
+            # Recorded where the run starts; its final text is filled in by
+            # flush_text()
+            command = EditText(self.canvas.index_of(container), self._texts[container])
+            self._push(command)
+            self._editing = (container, command)
+        self._text_timer.start()